@@ -1,5 +1,6 @@
 import tkinter as tk
 from PIL import Image, ImageTk
+from pekseg_sprites import open_segment
 import json
 import os
 
@@ -20,7 +21,7 @@ DISPLAY_HEIGHT = int(CHAR_HEIGHT * SCALE)
 
 # Load segment images
 segment_images = {
-    i: Image.open(f"{SEGMENT_FOLDER}/{i}.png").convert("RGBA").resize((DISPLAY_WIDTH, DISPLAY_HEIGHT), resample=Image.BICUBIC)
+    i: open_segment(f"{SEGMENT_FOLDER}/{i}.png").resize((DISPLAY_WIDTH, DISPLAY_HEIGHT), resample=Image.BICUBIC)
     for i in range(SEGMENT_COUNT)
 }
 
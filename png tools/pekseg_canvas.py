@@ -0,0 +1,167 @@
+# pekseg_canvas.py
+from PIL import Image, ImageChops, ImageDraw, ImageTk
+from pekseg_parser import scroll_masks
+
+# ─────────────────────────────────────────────
+# SLOT CANVAS
+# Keeps one image item and one text item per slot alive for the lifetime of
+# the canvas. Redrawing a slot pastes new pixels into its existing PhotoImage
+# instead of deleting everything and creating 108 new Tk objects per frame.
+#
+# Scrolls logged on the buffer take a fast path when no per-slot text is
+# drawn: the pixels already on screen are moved (image items here, one
+# framebuffer offset below) and only slots whose mask or attributes differ
+# from what ended up under them get redrawn.
+class SlotCanvas:
+    def __init__(self, canvas, cols, rows, glyph_width, glyph_height):
+        self.canvas = canvas
+        self.cols = cols
+        self.rows = rows
+        self.glyph_width = glyph_width
+        self.glyph_height = glyph_height
+        self.photos = [None] * (cols * rows)
+        self.image_items = [None] * (cols * rows)
+        self.text_items = [None] * (cols * rows)
+        self.painted = [False] * (cols * rows)
+        self.shown = [None] * (cols * rows)  # slot_state() each slot was last drawn with
+        self.has_text = False
+        self.color_state = None
+
+    def slot_origin(self, idx):
+        return (idx % self.cols) * self.glyph_width, (idx // self.cols) * self.glyph_height
+
+    def unpainted(self):
+        """Slots that have never been drawn (first frame, or after reset())."""
+        return {idx for idx, painted in enumerate(self.painted) if not painted}
+
+    def slot_state(self, glyph_buffer, idx):
+        """What a slot's pixels depend on: its mask, and its color/brightness if it has any."""
+        attrs = glyph_buffer.attr_key(idx) if glyph_buffer.has_attrs else None
+        return glyph_buffer.masks[idx] if attrs is None else (glyph_buffer.masks[idx], attrs)
+
+    def pending_slots(self, glyph_buffer, color_state, animated=False):
+        """Slots that need a redraw this frame.
+
+        Dirty and never-drawn slots always; every slot when the color state
+        changed; every lit slot in animated color modes, since their colors
+        move with frame_count even when the segments don't.
+        """
+        masks = glyph_buffer.masks
+        scrolls = glyph_buffer.take_scrolls()
+        pending = glyph_buffer.take_dirty() | self.unpainted()
+        if color_state != self.color_state:
+            self.color_state = color_state
+            pending = set(range(len(self.painted)))
+        else:
+            if scrolls and not self.has_text:
+                for dx, dy, fill in scrolls:
+                    self.scroll(dx, dy, fill is None)
+                # Mask and attributes: a slot can be dirty for its COLOR/BRIGHTNESS alone
+                pending = {idx for idx, shown in enumerate(self.shown)
+                           if shown != self.slot_state(glyph_buffer, idx)}
+            if animated:
+                pending |= {idx for idx, mask in enumerate(masks) if mask}
+        # Callers draw every slot handed back, so that's what will be on screen
+        for idx in pending:
+            self.shown[idx] = self.slot_state(glyph_buffer, idx)
+        return pending
+
+    def scroll_sources(self, dx, dy, wrap):
+        """For each slot, the slot its pixels come from, and which slots are new."""
+        slots = list(range(len(self.painted)))
+        sources = scroll_masks(slots, self.cols, dx, dy)
+        exposed = set()
+        if not wrap:
+            exposed = {idx for idx, src in enumerate(scroll_masks(slots, self.cols, dx, dy, -1)) if src < 0}
+        return sources, exposed
+
+    def scroll(self, dx, dy, wrap=True):
+        """Move the slot images on screen; exposed slots get redrawn later."""
+        sources, exposed = self.scroll_sources(dx, dy, wrap)
+        self.photos = [self.photos[src] for src in sources]
+        self.image_items = [self.image_items[src] for src in sources]
+        self.shown = [None if idx in exposed else self.shown[src] for idx, src in enumerate(sources)]
+        for idx, item in enumerate(self.image_items):
+            if item is not None:
+                self.canvas.coords(item, *self.slot_origin(idx))
+
+    def update_slot(self, idx, image, text=None):
+        self.painted[idx] = True
+        photo = self.photos[idx]
+        if photo is None:
+            x, y = self.slot_origin(idx)
+            photo = self.photos[idx] = ImageTk.PhotoImage(image)
+            self.image_items[idx] = self.canvas.create_image(x, y, anchor="nw", image=photo)
+            if text is not None:
+                self.has_text = True
+                self.text_items[idx] = self.canvas.create_text(
+                    x + 5, y + 5, anchor="nw", text=text, fill="white", font=("Courier", 8))
+        else:
+            photo.paste(image)
+            if text is not None and self.text_items[idx] is not None:
+                self.canvas.itemconfigure(self.text_items[idx], text=text)
+
+    def present(self):
+        # Slot items update as they're pasted, nothing left to push
+        pass
+
+    def reset(self):
+        self.canvas.delete("all")
+        self.photos = [None] * (self.cols * self.rows)
+        self.image_items = [None] * (self.cols * self.rows)
+        self.text_items = [None] * (self.cols * self.rows)
+        self.painted = [False] * (self.cols * self.rows)
+        self.shown = [None] * (self.cols * self.rows)
+        self.has_text = False
+        self.color_state = None
+
+# ─────────────────────────────────────────────
+# FRAME CANVAS
+# Same interface, but the whole grid is one framebuffer image behind one
+# PhotoImage and one canvas item. Slots are pasted into the framebuffer
+# (debug text, when given, is drawn onto the slot first), and present()
+# pushes it to Tk with a single paste. No Tk objects are created after the
+# first frame.
+class FrameCanvas(SlotCanvas):
+    def __init__(self, canvas, cols, rows, glyph_width, glyph_height):
+        super().__init__(canvas, cols, rows, glyph_width, glyph_height)
+        self.framebuffer = Image.new("RGBA", (cols * glyph_width, rows * glyph_height), (0, 0, 0, 255))
+        self.photo = None
+        self.image_item = None
+        self.changed = False
+
+    def update_slot(self, idx, image, text=None):
+        self.painted[idx] = True
+        x, y = self.slot_origin(idx)
+        if text is not None:
+            # Onto a copy (tiles are shared), so the text is clipped to this slot
+            # and can't leave pixels in its neighbours that nothing redraws
+            self.has_text = True
+            image = image.copy()
+            ImageDraw.Draw(image).multiline_text((5, 5), text, fill="white")
+        self.framebuffer.paste(image, (x, y))
+        self.changed = True
+
+    def scroll(self, dx, dy, wrap=True):
+        sources, exposed = self.scroll_sources(dx, dy, wrap)
+        shifted = ImageChops.offset(self.framebuffer, dx * self.glyph_width, dy * self.glyph_height)
+        self.framebuffer.paste(shifted)
+        self.shown = [None if idx in exposed else self.shown[src] for idx, src in enumerate(sources)]
+        self.changed = True
+
+    def present(self):
+        if not self.changed:
+            return
+        if self.photo is None:
+            self.photo = ImageTk.PhotoImage(self.framebuffer)
+            self.image_item = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+        else:
+            self.photo.paste(self.framebuffer)
+        self.changed = False
+
+    def reset(self):
+        super().reset()
+        self.framebuffer.paste((0, 0, 0, 255), (0, 0) + self.framebuffer.size)
+        self.photo = None
+        self.image_item = None
+        self.changed = False
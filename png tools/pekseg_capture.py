@@ -0,0 +1,355 @@
+# pekseg_capture.py
+import mmap
+import struct
+import sys
+import time
+from array import array
+
+from pekseg_parser import COMMIT_BYTES, PeksegDevice, is_commit
+
+# ─────────────────────────────────────────────
+# CAPTURE FORMAT
+# A .bin dump is just the bytes: no timing, and frame N means replaying
+# everything before it. A capture (.pkc) keeps the bytes as they arrived,
+# with timestamps, plus enough to jump anywhere:
+#
+#   header    magic "PKSGCAP1", version, cols, rows, keyframe interval K
+#   records   type:u8  timestamp_ns:u64  length:u32  payload
+#               DATA      input bytes; every commit ends a DATA record
+#               KEYFRAME  whole device state, after frame 0, K, 2K, ...
+#               INDEX     written by close(): per frame (timestamp, offset
+#                         just past its commit), then one offset per keyframe
+#   trailer   index offset, frame count, keyframe count, magic "PKSGIDX1"
+#
+# Frame n = the state right after the n-th commit (frame 0 = the start).
+# Seeking restores keyframe n // K and replays at most K frames of DATA.
+# A capture that never got closed has no trailer; the reader rebuilds the
+# index with one pass over the records.
+MAGIC = b"PKSGCAP1"
+INDEX_MAGIC = b"PKSGIDX1"
+VERSION = 2  # 2: keyframes carry slot colors and brightness
+KEYFRAME_INTERVAL = 256
+
+HEADER = struct.Struct("<8sHHHI")
+RECORD = struct.Struct("<BQI")
+KEYFRAME = struct.Struct("<QIBQQ")  # frame, cursor, mode, frame_count, commits; masks follow
+TRAILER = struct.Struct("<QQQ8s")
+
+DATA = 1
+KEYFRAME_RECORD = 2
+INDEX = 3
+
+MODES = ["SEG", "CHAR"]
+
+def keyframe_payload(frame, device):
+    state = KEYFRAME.pack(frame, device.current_index, MODES.index(device.mode),
+                          device.frame_count, device.commits)
+    return state + device.glyph_buffer.snapshot()
+
+def restore_keyframe(payload, device):
+    """Load a KEYFRAME payload into a device, both buffers. Returns its frame number."""
+    frame, cursor, mode, frame_count, commits = KEYFRAME.unpack_from(payload)
+    snapshot = bytes(payload[KEYFRAME.size:])
+    device.glyph_buffer.restore(snapshot)
+    device.front_buffer.restore(snapshot)
+    device.current_index = cursor
+    device.mode = MODES[mode]
+    device.frame_count = frame_count
+    device.commits = commits
+    device.pending_op = None
+    return frame
+
+# ─────────────────────────────────────────────
+# WRITER
+class CaptureWriter:
+    """Records a byte stream into a capture file.
+
+    Runs its own PeksegDevice alongside to know where frames end and what to
+    put in keyframes. Pass `device` to start from that device's state instead
+    of a blank grid. Timestamps are nanoseconds since the writer was opened.
+    """
+
+    def __init__(self, path, cols=12, rows=9, glyph_map=None, device=None,
+                 keyframe_interval=KEYFRAME_INTERVAL, clock=time.monotonic_ns):
+        if device is not None:
+            cols, rows, glyph_map = device.cols, device.rows, glyph_map or device.glyph_map
+        self.device = PeksegDevice(cols, rows, glyph_map, name="capture")
+        if device is not None:
+            # Whole committed state, slot colors and brightness included, like restore_keyframe()
+            snapshot = device.front_buffer.snapshot()
+            self.device.glyph_buffer.restore(snapshot)
+            self.device.front_buffer.restore(snapshot)
+            self.device.current_index, self.device.mode = device.current_index, device.mode
+            self.device.frame_count, self.device.commits = device.frame_count, device.commits
+        self.keyframe_interval = keyframe_interval
+        self.clock = clock
+        self.started = clock()
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, cols, rows, keyframe_interval))
+        self.frames = array("Q")     # timestamp, end offset per frame
+        self.keyframes = array("Q")  # record offset per keyframe
+        self.write_record(KEYFRAME_RECORD, 0, keyframe_payload(0, self.device), keyframe=True)
+        self.frames.extend((0, self.file.tell()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def frame_count(self):
+        return len(self.frames) // 2 - 1
+
+    def write_record(self, kind, timestamp, payload, keyframe=False):
+        if keyframe:
+            self.keyframes.append(self.file.tell())
+        self.file.write(RECORD.pack(kind, timestamp, len(payload)))
+        self.file.write(payload)
+
+    def write(self, data, timestamp=None):
+        """Record bytes that arrived at `timestamp` (ns since open; now if None)."""
+        if timestamp is None:
+            timestamp = self.clock() - self.started
+        view = memoryview(data)
+        start = 0
+        for match in COMMIT_BYTES.finditer(view):
+            end = match.end()
+            events = self.device.handle_bytes(view[start:end])
+            self.write_record(DATA, timestamp, view[start:end])
+            committed = is_commit(events, end - start)
+            start = end
+            if not committed:
+                continue
+            self.frames.extend((timestamp, self.file.tell()))
+            frame = self.frame_count
+            if frame % self.keyframe_interval == 0:
+                self.write_record(KEYFRAME_RECORD, timestamp, keyframe_payload(frame, self.device), keyframe=True)
+        if start < len(view):
+            self.device.handle_bytes(view[start:])
+            self.write_record(DATA, timestamp, view[start:])
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        payload = self.frames.tobytes() + self.keyframes.tobytes()
+        self.write_record(INDEX, self.clock() - self.started, payload)
+        self.file.write(TRAILER.pack(index_offset, self.frame_count, len(self.keyframes), INDEX_MAGIC))
+        self.file.close()
+
+# ─────────────────────────────────────────────
+# READER
+class CaptureReader:
+    """Memory-mapped view of a capture; nothing is read until it's asked for.
+
+    frame_count, timestamp(n) and the keyframe lookup are O(1) reads out of
+    the mapped index, so multi-gigabyte captures open instantly. Pass the
+    glyph map the stream was recorded with, or CHAR mode text won't replay.
+    """
+
+    def __init__(self, path, glyph_map=None):
+        self.path = path
+        self.glyph_map = glyph_map
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, version, self.cols, self.rows, self.keyframe_interval = HEADER.unpack_from(self.view)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path}: not a pekseg capture")
+        self.data_end = len(self.view)
+        self.frames, self.keyframes = self.load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for name in ("frames", "keyframes"):
+            index = getattr(self, name, None)
+            if isinstance(index, memoryview):
+                index.release()
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def load_index(self):
+        if len(self.view) >= HEADER.size + TRAILER.size:
+            index_offset, frames, keyframes, magic = TRAILER.unpack_from(self.view, len(self.view) - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                self.data_end = index_offset
+                start = index_offset + RECORD.size
+                middle = start + 16 * (frames + 1)
+                end = middle + 8 * keyframes
+                return self.view[start:middle].cast("Q"), self.view[middle:end].cast("Q")
+        return self.scan_index()
+
+    def scan_index(self):
+        """Rebuild the index from the records, for captures cut off before close()."""
+        frames, keyframes = array("Q"), array("Q")
+        device = PeksegDevice(self.cols, self.rows, self.glyph_map)
+        for offset, kind, timestamp, payload in self.records(HEADER.size):
+            end = offset + RECORD.size + len(payload)
+            if kind == KEYFRAME_RECORD:
+                keyframes.append(offset)
+                if not frames:
+                    frames.extend((0, end))
+            elif kind == DATA:
+                events = device.handle_bytes(payload)
+                if is_commit(events, len(payload)):
+                    frames.extend((timestamp, end))
+        return frames, keyframes
+
+    def records(self, start, stop=None):
+        """Yield (offset, kind, timestamp_ns, payload memoryview) from `start` up to `stop`."""
+        view = self.view
+        stop = min(stop or self.data_end, self.data_end)
+        offset = start
+        while offset + RECORD.size <= stop:
+            kind, timestamp, length = RECORD.unpack_from(view, offset)
+            body = offset + RECORD.size
+            if body + length > stop:
+                return  # torn record at the end of an unclosed capture
+            yield offset, kind, timestamp, view[body:body + length]
+            offset = body + length
+
+    @property
+    def frame_count(self):
+        """Frames after frame 0, i.e. commits recorded."""
+        return len(self.frames) // 2 - 1
+
+    @property
+    def duration(self):
+        return self.timestamp(self.frame_count) / 1e9
+
+    def timestamp(self, frame):
+        return self.frames[2 * frame]
+
+    def frame_end(self, frame):
+        """File offset just past the commit that produced `frame`."""
+        return self.frames[2 * frame + 1]
+
+    def frame_at(self, timestamp):
+        """Last frame committed at or before `timestamp` (ns), by binary search."""
+        lo, hi = 0, self.frame_count
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.timestamp(mid) <= timestamp:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def seek(self, frame, device=None):
+        """A device holding `frame`: nearest keyframe, then at most K frames of replay
+        (more only at the end of a capture that was cut off mid-keyframe).
+
+        Loads into `device` if given (it must be the capture's size), otherwise
+        into a new one. Returns the device.
+        """
+        if not 0 <= frame <= self.frame_count:
+            raise IndexError(f"frame {frame} out of range 0..{self.frame_count}")
+        if device is None:
+            device = PeksegDevice(self.cols, self.rows, self.glyph_map)
+        # An unclosed capture can end inside the keyframe after its last
+        # frames; replay those from the last keyframe that made it to disk
+        offset = self.keyframes[min(frame // self.keyframe_interval, len(self.keyframes) - 1)]
+        _, kind, _, payload = next(self.records(offset))
+        restore_keyframe(payload, device)
+        start = offset + RECORD.size + len(payload)
+        for _, kind, _, payload in self.records(start, self.frame_end(frame)):
+            if kind == DATA:
+                device.handle_bytes(payload, self.glyph_map)
+        return device
+
+    def data(self, start_frame=0, end_frame=None):
+        """Yield (timestamp_ns, payload) for the input between two frames."""
+        end = self.frame_end(end_frame) if end_frame is not None else self.data_end
+        for _, kind, timestamp, payload in self.records(self.frame_end(start_frame), end):
+            if kind == DATA:
+                yield timestamp, payload
+
+# ─────────────────────────────────────────────
+# TIMED PLAYBACK
+# Feeds the recorded input back at the pace it was captured (scaled by
+# `speed`) through Tk-style after(), so the UI thread never sleeps. feed is
+# whatever the display takes bytes through, e.g. dispatch.bytes.
+class CapturePlayer:
+    def __init__(self, reader, feed, after, speed=1.0, clock=time.monotonic):
+        self.reader = reader
+        self.feed = feed
+        self.after = after
+        self.speed = speed
+        self.clock = clock
+        self.pending = None
+        self.playing = False
+
+    def play(self, start_frame=0, device=None):
+        """Start from `start_frame`; loads that frame into `device` first if given."""
+        if device is not None:
+            self.reader.seek(start_frame, device)
+        self.records = self.reader.data(start_frame)
+        self.base_ns = self.reader.timestamp(start_frame)
+        self.started = self.clock()
+        self.pending = next(self.records, None)
+        self.playing = True
+        self._step()
+
+    def stop(self):
+        self.playing = False
+
+    def _step(self):
+        if not self.playing:
+            return
+        elapsed_ns = (self.clock() - self.started) * self.speed * 1e9
+        while self.pending is not None and self.pending[0] - self.base_ns <= elapsed_ns:
+            self.feed(bytes(self.pending[1]))
+            self.pending = next(self.records, None)
+        if self.pending is None:
+            self.playing = False
+            return
+        wait = (self.pending[0] - self.base_ns - elapsed_ns) / 1e9 / self.speed
+        self.after(max(1, round(wait * 1000)), self._step)
+
+# ─────────────────────────────────────────────
+# COMMAND LINE
+#   python pekseg_capture.py record SOURCE out.pkc [glyph_map.json]   (any pekseg_ingest source)
+#   python pekseg_capture.py info capture.pkc
+# record needs the glyph map the display uses, or CHAR-mode text lands in the
+# keyframes as the wrong segments; glyph_map.json is used when it's there.
+GLYPH_MAP_FILE = "glyph_map.json"
+
+if __name__ == "__main__":
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "record":
+        import asyncio
+        import os
+        from pekseg_ingest import iter_readers
+        from pekseg_parser import load_glyph_map
+
+        map_path = sys.argv[4] if len(sys.argv) == 5 else GLYPH_MAP_FILE
+        glyph_map = None
+        if len(sys.argv) == 5 or os.path.exists(map_path):
+            glyph_map = load_glyph_map(map_path)
+        else:
+            print(f"[CAPTURE] no {map_path}, CHAR-mode bytes will record as blank slots")
+
+        async def record(spec, path):
+            with CaptureWriter(path, glyph_map=glyph_map) as writer:
+                async for reader in iter_readers(spec):
+                    while chunk := await reader.read(64 * 1024):
+                        writer.write(chunk)
+                    print(f"[CAPTURE] {writer.frame_count} frames so far")
+
+        try:
+            asyncio.run(record(sys.argv[2], sys.argv[3]))
+        except KeyboardInterrupt:
+            pass
+    elif len(sys.argv) == 3 and sys.argv[1] == "info":
+        with CaptureReader(sys.argv[2]) as reader:
+            print(f"{reader.cols}x{reader.rows}, {reader.frame_count} frames, {reader.duration:.2f}s, "
+                  f"keyframe every {reader.keyframe_interval}, {len(reader.keyframes)} keyframes")
+    else:
+        print("usage: pekseg_capture.py record SOURCE OUT.pkc [GLYPH_MAP.json] | info CAPTURE.pkc")
@@ -0,0 +1,100 @@
+# pekseg_colors.py
+import colorsys
+
+import numpy as np
+
+# ─────────────────────────────────────────────
+# COLOR MODES
+# A color mode is a function (slots, user_selected_color, frame_count) ->
+# array broadcastable to (slots, 47, 3) uint8: the RGB of every segment of
+# every slot for one frame. Renderers call it once per frame instead of once
+# per lit segment, and nothing in the render loop knows the mode names.
+# Adding a mode is one decorated function:
+#
+#     @color_mode("wave", period=72, per_slot=True)
+#     def wave(slots, color, frame):
+#         return HUE_LUT[(np.arange(slots) * 10 + frame * 5) % 360][:, None, :]
+#
+# period: the mode repeats every `period` frames (None = doesn't animate),
+# which is what tile caches key on. per_slot: colors differ between slots,
+# so a tile can't be shared by two slots showing the same segments.
+SEGMENT_COUNT = 47
+SEGMENT_IDS = np.arange(SEGMENT_COUNT)
+
+# int(c * 255) of colorsys.hsv_to_rgb(deg / 360, 1, 1), for every whole degree
+HUE_LUT = np.array([[int(c * 255) for c in colorsys.hsv_to_rgb(deg / 360, 1, 1)] for deg in range(360)],
+                   dtype=np.uint8)
+TRANS_PALETTE = np.array([(173, 216, 230), (255, 182, 193), (255, 255, 255)], dtype=np.uint8)
+
+class ColorMode:
+    def __init__(self, name, colors, period=None, per_slot=False):
+        self.name = name
+        self.colors = colors
+        self.period = period
+        self.per_slot = per_slot
+
+    def __repr__(self):
+        return f"ColorMode({self.name}, period={self.period}, per_slot={self.per_slot})"
+
+    @property
+    def animated(self):
+        return self.period is not None
+
+    def key(self, user_selected_color, frame_count):
+        """Everything about this mode's colors that can change how a tile looks."""
+        if self.period is None:
+            return (self.name, tuple(user_selected_color))
+        return (self.name, frame_count % self.period)
+
+    def array(self, slots, user_selected_color, frame_count):
+        colors = np.asarray(self.colors(slots, user_selected_color, frame_count), dtype=np.uint8)
+        # Read-only broadcast view, no copy for modes that don't vary by slot
+        return np.broadcast_to(colors, (slots, SEGMENT_COUNT, 3))
+
+COLOR_MODES = {}
+
+def color_mode(name, period=None, per_slot=False):
+    """Decorator registering a color mode function under `name`."""
+    def register(colors):
+        COLOR_MODES[name] = ColorMode(name, colors, period, per_slot)
+        return colors
+    return register
+
+def get_mode(name):
+    """The registered mode, or static for names nothing registered."""
+    return COLOR_MODES.get(name) or COLOR_MODES["static"]
+
+def color_array(name, slots, user_selected_color, frame_count):
+    return get_mode(name).array(slots, user_selected_color, frame_count)
+
+# ─────────────────────────────────────────────
+# BUILT-IN MODES
+@color_mode("static")
+def static(slots, color, frame):
+    return np.array(color[:3], dtype=np.uint8)
+
+# Hue (i * 10 + frame * 5) % 360, so the whole cycle is 72 frames
+@color_mode("rainbow", period=72)
+def rainbow(slots, color, frame):
+    return HUE_LUT[(SEGMENT_IDS * 10 + frame * 5) % 360]
+
+@color_mode("trans", period=len(TRANS_PALETTE))
+def trans(slots, color, frame):
+    return TRANS_PALETTE[(SEGMENT_IDS + frame) % len(TRANS_PALETTE)]
+
+# ─────────────────────────────────────────────
+# SLOT ATTRIBUTES
+def apply_slot_attributes(colors, rgb, levels):
+    """Mode colors with the slots' own attributes on top, as a new uint8 array.
+
+    colors is (slots, 47, 3); rgb is (slots, 3), where a nonzero row replaces
+    the mode's colors for that slot; levels is (slots, 47) brightness, applied
+    as a multiply (255 = unchanged).
+    """
+    out = np.array(colors, dtype=np.uint16)
+    own = rgb.any(axis=1)
+    out[own] = rgb[own][:, None, :]
+    out *= levels[:, :, None]
+    out += 127
+    out //= 255
+    return out.astype(np.uint8)
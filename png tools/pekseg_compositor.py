@@ -0,0 +1,187 @@
+# pekseg_compositor.py
+import numpy as np
+
+# ─────────────────────────────────────────────
+# VECTORIZED COMPOSITOR
+# Same picture as the PIL path in render_display, byte for byte, but for
+# many slots at once. Every tile is opaque, and over an opaque base
+# alpha_composite is plain integer math (see over()), so the compositor
+# replays exactly the layers PIL would, just vectorized across slots:
+#   - the ghost layer (backdrop + faded background segments) is built once
+#     per combination and kept, like Renderer.ghost_layer()
+#   - pixels are sorted by how many foreground segments cover them, so
+#     "first segment", "second segment", ... are each one blend over a
+#     prefix of the pixels instead of a loop over 39 segments; where a
+#     single opaque segment covers a pixel it's just a select
+#   - colorize() is gray * color // 255, with ImageOps.grayscale's weights
+# Slots go through in batches small enough to stay in cache, and tiles come
+# out as packed RGBA words put back in raster order with one take().
+SEGMENT_COUNT = 47
+FOREGROUND_COUNT = 39
+GHOST_ALPHA = 30
+BATCH = 32
+OPAQUE = 0xFF000000
+
+def over(dst, src, alpha):
+    """alpha_composite of src at `alpha` onto opaque dst, rounded like PIL does.
+
+    PIL computes SHIFTFORDIV255(src*a*128 + dst*(255-a)*128 + (0x80 << 7)) >> 7,
+    which comes out to the usual (x + (x >> 8)) >> 8 division by 255 and
+    fits in uint16. alpha 0 leaves dst as it is.
+    """
+    x = src * alpha + dst * (255 - alpha) + 128
+    return (x + (x >> 8)) >> 8
+
+def pack(planes):
+    """(3, ...) channel planes -> packed little-endian RGBA words, alpha 255."""
+    r, g, b = planes.astype("<u4")
+    return r | g << 8 | b << 16 | OPAQUE
+
+class FrameCompositor:
+    def __init__(self, sprites, glyph_width, glyph_height):
+        """sprites: {segment: pekseg_sprites.Sprite} on a glyph_width x glyph_height canvas."""
+        self.glyph_width = glyph_width
+        self.glyph_height = glyph_height
+        pixels = glyph_width * glyph_height
+        rgb = np.zeros((SEGMENT_COUNT, pixels, 3), dtype=np.int32)
+        alpha = np.zeros((SEGMENT_COUNT, pixels), dtype=np.int32)
+        for seg, sprite in sprites.items():
+            # Only the sprite's box is filled in; the rest stays transparent black
+            rgba = np.asarray(sprite.image.convert("RGBA"), dtype=np.int32)
+            x0, y0, x1, y1 = sprite.box
+            rgb[seg].reshape(glyph_height, glyph_width, 3)[y0:y1, x0:x1] = rgba[..., :3]
+            alpha[seg].reshape(glyph_height, glyph_width)[y0:y1, x0:x1] = rgba[..., 3]
+        # ImageOps.grayscale is convert("L"): (r*19595 + g*38470 + b*7471 + 0x8000) >> 16
+        gray = (rgb @ np.array([19595, 38470, 7471]) + 0x8000) >> 16
+
+        # Pixel order: most foreground layers first, opaque ones last within a count
+        fg_alpha = alpha[:FOREGROUND_COUNT]
+        counts = (fg_alpha > 0).sum(axis=0)
+        opaque = (counts == 1) & (fg_alpha.max(axis=0) == 255)
+        self.order = np.lexsort((opaque, -counts))
+        self.unorder = np.argsort(self.order)
+        counts = counts[self.order]
+        self.covered = np.count_nonzero(counts)
+
+        # Layer k: the k-th foreground segment (lowest first) over every pixel
+        # that has more than k of them, i.e. the first n pixels in our order.
+        # (n, segment per pixel, gray per pixel, alpha per pixel)
+        covering = [np.flatnonzero(fg_alpha[:, p]) for p in self.order[:self.covered]]
+        first = np.array([segs[0] for segs in covering], dtype=np.intp)
+        px = self.order[:self.covered]
+        # The single opaque pixels come off the end of layer 0 and just take the
+        # segment's color (pixels solid..covered, same tuple layout)
+        self.solid = self.covered - np.count_nonzero(opaque)
+        self.layers = []
+        for k in range(counts.max(initial=0)):
+            n = np.count_nonzero(counts > k)
+            segs = first[:n] if k == 0 else np.array([covering[i][k] for i in range(n)], dtype=np.intp)
+            self.layers.append((n, segs, gray[segs, px[:n]].astype(np.uint16),
+                                fg_alpha[segs, px[:n]].astype(np.uint16)))
+        self.solid_layer = None
+        if self.layers:
+            n, segs, seg_gray, seg_alpha = self.layers[0]
+            cut = self.solid
+            self.layers[0] = (cut, segs[:cut], seg_gray[:cut], seg_alpha[:cut])
+            self.solid_layer = (segs[cut:], seg_gray[cut:], seg_alpha[cut:])
+
+        # Ghosts, channel planar in pixel order; a ghost without a sprite isn't drawn at all
+        self.ghost_rgb = rgb[FOREGROUND_COUNT:][:, self.order].transpose(0, 2, 1).astype(np.uint16)
+        self.ghost_alpha = np.array([GHOST_ALPHA if seg in sprites else 0
+                                     for seg in range(FOREGROUND_COUNT, SEGMENT_COUNT)], dtype=np.uint16)
+        self.ghost_layers = {}  # (ghost bits, backdrop) -> (packed words, covered pixels planar)
+        self.bits = np.array([1 << seg for seg in range(SEGMENT_COUNT)], dtype=np.uint64)
+
+    def weights(self, masks):
+        """(slots,) uint64 masks -> (slots, 47) uint16 0/1 matrix."""
+        masks = np.asarray(masks, dtype=np.uint64)
+        return ((masks[:, None] & self.bits) != 0).astype(np.uint16)
+
+    def compose_slots(self, masks, colors, backdrop=None, intensity=None):
+        """Render a batch of slots to a (slots, H, W, 4) uint8 array.
+
+        colors is (47, 3) for one color per segment id, or (slots, 47, 3)
+        when every slot carries its own colors. backdrop is an optional
+        (slots, 3) opaque color each tile starts from instead of black.
+        intensity is an optional (slots, 47) 0..1 opacity per segment that
+        scales the foreground segments' alpha (afterglow).
+        """
+        weights = self.weights(masks)
+        slots = len(weights)
+        colors = np.asarray(colors).astype(np.uint16)
+        if backdrop is None:
+            backdrop = np.zeros((slots, 3), dtype=np.uint16)
+        backdrop = np.asarray(backdrop).astype(np.uint16)
+        if intensity is not None:
+            intensity = np.asarray(intensity, dtype=np.float32)
+        keys = list(zip((weights[:, FOREGROUND_COUNT:] << np.arange(SEGMENT_COUNT - FOREGROUND_COUNT,
+                                                                    dtype=np.uint16)).sum(axis=1).tolist(),
+                        map(tuple, backdrop.tolist())))
+        self.build_ghost_layers(keys)
+        packed = np.empty((slots, self.glyph_width * self.glyph_height), dtype="<u4")
+        for start in range(0, slots, BATCH):
+            batch = slice(start, start + BATCH)
+            packed[batch] = self.compose_batch(
+                weights[batch], keys[batch],
+                colors if colors.ndim == 2 else colors[batch],
+                None if intensity is None else intensity[batch])
+        tiles = packed.take(self.unorder, axis=1)
+        return tiles.view(np.uint8).reshape(slots, self.glyph_height, self.glyph_width, 4)
+
+    def build_ghost_layers(self, keys):
+        """Fill in ghost_layers for the (ghost bits, backdrop) combinations not seen yet."""
+        missing = list(dict.fromkeys(key for key in keys if key not in self.ghost_layers))
+        if not missing:
+            return
+        # Each lit ghost washes the whole tile at alpha 30, in segment order
+        ghosts = np.array([[ghosts >> g & 1 for g in range(len(self.ghost_alpha))] for ghosts, _ in missing],
+                          dtype=np.uint16) * self.ghost_alpha
+        layer = np.empty((3, len(missing), len(self.order)), dtype=np.uint16)
+        layer[:] = np.array([rgb for _, rgb in missing], dtype=np.uint16).T[:, :, None]
+        for g, rgb in enumerate(self.ghost_rgb):
+            layer = over(layer, rgb[:, None, :], ghosts[:, g, None])
+        words = pack(layer)
+        for i, key in enumerate(missing):
+            self.ghost_layers[key] = (words[i], layer[:, i, :self.covered].copy())
+
+    def compose_batch(self, weights, keys, colors, intensity):
+        """(slots, pixels) packed RGBA words for one batch, pixels in self.order."""
+        layers = [self.ghost_layers[key] for key in keys]
+        packed = np.stack([words for words, _ in layers])
+        out = np.stack([planes for _, planes in layers], axis=1)
+
+        # Foreground pass, one layer at a time over the pixels it reaches
+        def paint(segs, gray, alpha):
+            if colors.ndim == 2:
+                src = gray * colors[segs].T[:, None, :] // 255
+            else:
+                src = gray * colors[:, segs].transpose(2, 0, 1) // 255
+            if intensity is None:
+                return src, weights[:, segs] * alpha
+            return src, np.rint(intensity[:, segs] * alpha).astype(np.uint16)
+
+        for n, segs, gray, alpha in self.layers:
+            src, seg_alpha = paint(segs, gray, alpha)
+            part = out[:, :, :n]
+            part[:] = over(part, src, seg_alpha)
+        if self.solid_layer is not None:
+            src, seg_alpha = paint(*self.solid_layer)
+            part = out[:, :, self.solid:]
+            if intensity is None:
+                np.copyto(part, src, where=seg_alpha.astype(bool))
+            else:
+                part[:] = over(part, src, seg_alpha)
+
+        packed[:, :self.covered] = pack(out)
+        return packed
+
+    def compose_frame(self, masks, colors, cols):
+        """Render a whole grid to one (rows * H, cols * W, 4) uint8 array."""
+        tiles = self.compose_slots(masks, colors)
+        rows = -(-len(tiles) // cols)
+        if rows * cols != len(tiles):
+            pad = np.zeros((rows * cols - len(tiles),) + tiles.shape[1:], dtype=np.uint8)
+            pad[..., 3] = 255
+            tiles = np.concatenate([tiles, pad])
+        h, w = self.glyph_height, self.glyph_width
+        return tiles.reshape(rows, cols, h, w, 4).transpose(0, 2, 1, 3, 4).reshape(rows * h, cols * w, 4)
@@ -1,12 +1,12 @@
+import sys
 import tkinter as tk
 from tkinter import filedialog, colorchooser
+from pekseg_capture import CaptureReader, CapturePlayer
 from pekseg_display import launch_display
+from pekseg_loader import load_bin
 from pekseg_parser import glyph_buffer, init_buffer
 from pekseg_console import launch_console
 
-segment_color_mode = "static"
-user_selected_color = (255, 255, 255)
-
 def launch_console(dispatch, root):
     console = tk.Toplevel(root)
     console.title("PEKSEG Console")
@@ -23,32 +23,38 @@ def launch_console(dispatch, root):
 
     tk.Button(console, text="Send", command=send_command).grid(row=0, column=1, padx=5)
 
-    def load_bin():
-        path = filedialog.askopenfilename(filetypes=[("Binary files", "*.bin")])
-        if path:
-            with open(path, "rb") as f:
-                data = f.read()
-                for byte in data:
-                    dispatch(byte)
+    tk.Button(console, text="Load .bin", command=lambda: load_bin(root, dispatch.scheduler, ready=dispatch.ready)).grid(row=1, column=0, columnspan=2, pady=5)
 
-    tk.Button(console, text="Load .bin", command=load_bin).grid(row=1, column=0, columnspan=2, pady=5)
+    def play_capture():
+        path = filedialog.askopenfilename(filetypes=[("Captures", "*.pkc")])
+        if path:
+            if getattr(dispatch, "player", None):
+                dispatch.player.stop()
+                dispatch.player.reader.close()
+            reader = CaptureReader(path, dispatch.device.glyph_map)
+            # Replays with the original timing, starting from a clean frame 0
+            dispatch.player = CapturePlayer(reader, dispatch.bytes, root.after)
+            if dispatch.ingest is not None:
+                # The ingest thread owns the device: load frame 0 over there
+                dispatch.ingest.apply(lambda device: reader.seek(0, device))
+                dispatch.player.play(0)
+            else:
+                dispatch.player.play(0, dispatch.device)
+
+    tk.Button(console, text="Play Capture", command=play_capture).grid(row=4, column=0, columnspan=2, pady=5)
 
     def pick_color():
         color = colorchooser.askcolor(title="Pick Segment Color")
-        if color:
-            global user_selected_color, segment_color_mode
-            user_selected_color = tuple(map(int, color[0]))
-            segment_color_mode = "static"
+        if color[0]:
+            dispatch.device.set_colors("static", tuple(map(int, color[0])))
 
     tk.Button(console, text="Pick Color", command=pick_color).grid(row=2, column=0, pady=5)
 
     def set_rainbow():
-        global segment_color_mode
-        segment_color_mode = "rainbow"
+        dispatch.device.set_colors("rainbow")
 
     def set_trans():
-        global segment_color_mode
-        segment_color_mode = "trans"
+        dispatch.device.set_colors("trans")
 
     tk.Button(console, text="Rainbow Mode", command=set_rainbow).grid(row=2, column=1, pady=5)
     tk.Button(console, text="Trans Mode", command=set_trans).grid(row=3, column=0, columnspan=2, pady=5)
@@ -57,12 +63,15 @@ def launch_console(dispatch, root):
 if __name__ == "__main__":
     init_buffer(12, 9)  # ✅ Initialize buffer first
 
-    dispatch, root = launch_display()       # ✅ Now display binds to the correct buffer
+    # Optional live source: python pekseg_console.py /dev/ttyUSB0 (or tcp://host:port)
+    source = sys.argv[1] if len(sys.argv) > 1 else None
+    dispatch, root = launch_display(source)  # ✅ Now display binds to the correct buffer
     print(f"[DEBUG] glyph_buffer size: {len(glyph_buffer)}")  # Should be 108
 
     launch_console(dispatch, root)
 
-    glyph_buffer[0].add(33)                 # ✅ Safe to inject now
+    if not source:
+        glyph_buffer[0].add(33)             # ✅ Safe to inject now (a live source's thread owns it otherwise)
     dispatch(3)                             # Trigger render
 
     root.mainloop()
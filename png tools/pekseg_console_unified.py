@@ -1,7 +1,11 @@
 import tkinter as tk
-from tkinter import filedialog, colorchooser
-from PIL import Image, ImageTk, ImageOps
-import time, colorsys
+from tkinter import colorchooser
+from pekseg_parser import GlyphBuffer, glyph_table
+from pekseg_canvas import SlotCanvas, FrameCanvas
+from pekseg_render import Renderer, segment_color
+from pekseg_scheduler import FrameScheduler
+from pekseg_loader import load_bin
+import pekseg_trace as trace
 
 # ─────────────────────────────────────────────
 # CONFIG
@@ -11,10 +15,14 @@ GLYPH_WIDTH = 80
 GLYPH_HEIGHT = 99
 SEGMENT_COUNT = 47
 BAUD_DELAY = 1 / 60
+TILE_CACHE_BYTES = 32 * 1024 * 1024  # finished slot tiles kept around for reuse
+DISPLAY_MODE = "framebuffer"  # or "slots" for one canvas image + text item per slot
+DEBUG_OVERLAY = True  # slot index + segment list drawn over each slot
 
 # ─────────────────────────────────────────────
 # STATE
-glyph_buffer = []
+glyph_buffer = GlyphBuffer()  # back buffer, written by handle_byte
+front_buffer = GlyphBuffer()  # last committed frame, read by render_display
 current_index = 0
 mode = "SEG"
 frame_count = 0
@@ -24,13 +32,14 @@ user_selected_color = (255, 255, 255)
 # ─────────────────────────────────────────────
 # INIT BUFFER
 def init_buffer(cols, rows):
-    global glyph_buffer
-    glyph_buffer = [set() for _ in range(cols * rows)]
+    glyph_buffer.resize(cols * rows)
+    front_buffer.resize(cols * rows)
 
 # ─────────────────────────────────────────────
 def handle_byte(b, glyph_map=None):
     global current_index, mode, frame_count
-    print(f"[PARSER] Handling byte: {b}")
+    if trace.level >= trace.BYTE:
+        trace.record("PARSER", b, slot=current_index, mode=mode)
 
     if b == 0x01:  # START
         current_index = 0
@@ -38,13 +47,15 @@ def handle_byte(b, glyph_map=None):
         mode = "CHAR"
     elif b == 0x03:  # RENDER
         frame_count += 1
+        glyph_buffer.commit(front_buffer)
         return "RENDER"
     elif b == 0x04:  # FLUSH
+        glyph_buffer.commit(front_buffer)
         return "RENDER"
     elif b == 0x05:  # FORCE SEG MODE
         mode = "SEG"
     elif b == 0x08:  # CLEAR SLOT
-        glyph_buffer[current_index].clear()
+        glyph_buffer.set_mask(current_index, 0)
     elif b == 0x09:  # BAUD RATE
         return "BAUD"
     elif b == 0x0A:  # NEXT SLOT
@@ -54,20 +65,16 @@ def handle_byte(b, glyph_map=None):
     elif b == 0x1B:  # TOGGLE MODE
         mode = "SEG" if mode == "CHAR" else "CHAR"
     elif b == 0x7F:  # CLEAR ALL
-        for slot in glyph_buffer:
-            slot.clear()
+        glyph_buffer.clear_all()
     else:
         if mode == "SEG" and 33 <= b <= 79:
             seg_id = b - 33  # remap printable byte to segment ID
-            glyph_buffer[current_index].add(seg_id)
-            print(f"[PARSER] Added segment {seg_id} to slot {current_index}")
+            glyph_buffer.set_mask(current_index, glyph_buffer.masks[current_index] | (1 << seg_id))
             # ✅ No auto-advance here
         elif mode == "CHAR" and glyph_map:
-            char = chr(b)
-            segments = glyph_map.get(char)
-            if segments:
-                glyph_buffer[current_index] = set(segments)
-                print(f"[PARSER] Mapped '{char}' to segments {segments} in slot {current_index}")
+            glyph = glyph_table(glyph_map).lookup(b)
+            if glyph:
+                glyph_buffer.set_mask(current_index, glyph)
                 current_index = (current_index + 1) % len(glyph_buffer)
 
     return None
@@ -75,41 +82,24 @@ def handle_byte(b, glyph_map=None):
 
 # ─────────────────────────────────────────────
 # SEGMENT IMAGE LOADING
-segment_images = {}
-for i in range(SEGMENT_COUNT):
-    img = Image.open(f"segments/{i}.png").resize((GLYPH_WIDTH, GLYPH_HEIGHT), Image.Resampling.LANCZOS)
-    segment_images[i] = img.convert("RGBA")
+# Lit slots get a faint red wash so it's obvious which slots hold anything
+renderer = Renderer(GRID_COLS, GRID_ROWS, GLYPH_WIDTH, GLYPH_HEIGHT,
+                    tile_cache_bytes=TILE_CACHE_BYTES, lit_overlay=(255, 0, 0, 32))
+segment_sprites = renderer.sprites
 
 def get_segment_color(i):
-    global frame_count
-    if segment_color_mode == "static":
-        return user_selected_color
-    elif segment_color_mode == "rainbow":
-        hue = ((i * 10 + frame_count * 5) % 360) / 360
-        r, g, b = colorsys.hsv_to_rgb(hue, 1, 1)
-        return int(r * 255), int(g * 255), int(b * 255)
-    elif segment_color_mode == "trans":
-        palette = [(173,216,230), (255,182,193), (255,255,255)]
-        return palette[(i + frame_count) % len(palette)]
-
-def colorize_segment(img, rgb):
-    # Ensure RGB is in 0–255 range
-    if isinstance(rgb, tuple) and all(isinstance(c, float) for c in rgb):
-        rgb = tuple(int(c * 255) for c in rgb)
-
-    # Convert grayscale to color, then add alpha
-    gray = ImageOps.grayscale(img)
-    colored = ImageOps.colorize(gray, black="black", white=rgb)
-    return colored.convert("RGBA")
+    return segment_color(i, segment_color_mode, user_selected_color, frame_count)
 
 
 # ─────────────────────────────────────────────
 # DISPLAY SETUP
 canvas = None
-slot_images = []
+slot_canvas = None
+
+scheduler = None
 
 def launch_display():
-    global canvas, slot_images
+    global canvas, slot_canvas, scheduler
     init_buffer(GRID_COLS, GRID_ROWS)
     print(f"[DISPLAY INIT] glyph_buffer size: {len(glyph_buffer)}")
 
@@ -117,66 +107,48 @@ def launch_display():
     root.title("Segmented Display Simulator")
     canvas = tk.Canvas(root, width=GRID_COLS * GLYPH_WIDTH, height=GRID_ROWS * GLYPH_HEIGHT, bg="black")
     canvas.pack()
-    slot_images = [None] * (GRID_COLS * GRID_ROWS)
+    canvas_type = FrameCanvas if DISPLAY_MODE == "framebuffer" else SlotCanvas
+    slot_canvas = canvas_type(canvas, GRID_COLS, GRID_ROWS, GLYPH_WIDTH, GLYPH_HEIGHT)
 
-    def tick():
-        render_display()
-        root.after(int(BAUD_DELAY * 1000), tick)
+    # Ticks every BAUD_DELAY, but only presents on a commit or when committed
+    # slots changed since the last frame
+    scheduler = FrameScheduler(root.after, decode, render_display, BAUD_DELAY,
+                               idle_check=lambda: bool(front_buffer.dirty))
+    scheduler.start()
 
-    tick()
-    root.mainloop()
+    return dispatch, root
 
 def render_display():
-    global canvas, slot_images
-    canvas.delete("all")
-
-    for idx, segments in enumerate(glyph_buffer):
-        x = (idx % GRID_COLS) * GLYPH_WIDTH
-        y = (idx // GRID_COLS) * GLYPH_HEIGHT
-
-        base = Image.new("RGBA", (GLYPH_WIDTH, GLYPH_HEIGHT), (0, 0, 0, 255))
-
-        # Optional: debug overlay if slot has segments
-        if segments:
-            debug_overlay = Image.new("RGBA", (GLYPH_WIDTH, GLYPH_HEIGHT), (255, 0, 0, 32))
-            base.alpha_composite(debug_overlay)
-
-        # Background segments (39–46) with low alpha
-        for i in range(39, 47):
-            if i in segments:
-                faded = segment_images[i].copy()
-                faded.putalpha(30)
-                base.alpha_composite(faded)
-
-        # Foreground segments (0–38) with dynamic color
-        for i in segments:
-            if i < 39:
-                rgb = get_segment_color(i)
-                colored = colorize_segment(segment_images[i], rgb)
-                base.alpha_composite(colored)
-
-        slot_images[idx] = ImageTk.PhotoImage(base)
-        canvas.create_image(x, y, anchor="nw", image=slot_images[idx])
-
+    # Only slots that changed since the last frame get recomposited
+    renderer.set_colors(segment_color_mode, user_selected_color, frame_count)
+    color_state = (segment_color_mode, user_selected_color)
+    pending = slot_canvas.pending_slots(front_buffer, color_state, renderer.animated)
+    tiles = renderer.slot_tiles(front_buffer, pending)
+    for idx in sorted(pending):
+        segments = front_buffer[idx]
         # Slot index and segment list
-        slot_text = f"{idx}\n{sorted(list(segments))}"
-        canvas.create_text(x + 5, y + 5, anchor="nw", text=slot_text, fill="white", font=("Courier", 8))
-
-
-    def dispatch(b):
-        global frame_count
-        print(f"[DISPATCH] Byte received: {b}")
-        result = handle_byte(b)
-        print(f"[DISPATCH] Parser returned: {result}")
-        if result == "RENDER":
-            frame_count += 1
-            print(f"[DISPLAY] Rendering frame {frame_count}")
-            render_display()
-        elif result == "BAUD":
-            print("[DISPLAY] Baud pacing triggered")
-            time.sleep(BAUD_DELAY)
-
-    return dispatch, root
+        slot_text = f"{idx}\n{sorted(list(segments))}" if DEBUG_OVERLAY else None
+        slot_canvas.update_slot(idx, tiles[idx], slot_text)
+    slot_canvas.present()
+
+def decode(chunk):
+    events = []
+    try:
+        for pos, b in enumerate(chunk):
+            result = handle_byte(b)
+            if result:
+                events.append((pos, result))
+                if trace.level >= trace.INFO:
+                    trace.record("DISPATCH", b, result, current_index, mode, f"frame {frame_count}")
+    except Exception:
+        trace.dump()
+        raise
+    return events
+
+def dispatch(b):
+    if trace.level >= trace.BYTE:
+        trace.record("DISPATCH", b, note="received")
+    scheduler.feed(bytes([b]))
 
 # ─────────────────────────────────────────────
 # CONSOLE SETUP
@@ -196,15 +168,7 @@ def launch_console(dispatch, root):
 
     tk.Button(console, text="Send", command=send_command).grid(row=0, column=1, padx=5)
 
-    def load_bin():
-        path = filedialog.askopenfilename(filetypes=[("Binary files", "*.bin")])
-        if path:
-            with open(path, "rb") as f:
-                data = f.read()
-                for byte in data:
-                    dispatch(byte)
-
-    tk.Button(console, text="Load .bin", command=load_bin).grid(row=1, column=0, columnspan=2, pady=5)
+    tk.Button(console, text="Load .bin", command=lambda: load_bin(root, scheduler)).grid(row=1, column=0, columnspan=2, pady=5)
 
     def pick_color():
         color = colorchooser.askcolor(title="Pick Segment Color")
@@ -212,11 +176,12 @@ def launch_console(dispatch, root):
             global user_selected_color, segment_color_mode
             user_selected_color = tuple(map(int, color[0]))
             segment_color_mode = "static"
+            scheduler.request_frame()  # idle ticks only present dirty slots
 
     tk.Button(console, text="Pick Color", command=pick_color).grid(row=2, column=0, pady=5)
 
-    def set_rainbow(): global segment_color_mode; segment_color_mode = "rainbow"
-    def set_trans(): global segment_color_mode; segment_color_mode = "trans"
+    def set_rainbow(): global segment_color_mode; segment_color_mode = "rainbow"; scheduler.request_frame()
+    def set_trans(): global segment_color_mode; segment_color_mode = "trans"; scheduler.request_frame()
 
     tk.Button(console, text="Rainbow Mode", command=set_rainbow).grid(row=2, column=1, pady=5)
     tk.Button(console, text="Trans Mode", command=set_trans).grid(row=3, column=0, columnspan=2, pady=5)
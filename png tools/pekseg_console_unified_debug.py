@@ -1,6 +1,12 @@
 import tkinter as tk
-from PIL import Image, ImageTk, ImageOps
-import colorsys
+from pekseg_parser import GlyphBuffer, glyph_table
+from pekseg_canvas import SlotCanvas, FrameCanvas
+from pekseg_render import Renderer, segment_color
+from pekseg_sprites import open_sprite
+from pekseg_colors import get_mode
+from pekseg_scheduler import FrameScheduler
+from pekseg_loader import load_bin
+import pekseg_trace as trace
 import threading
 import sys
 
@@ -12,10 +18,14 @@ GLYPH_WIDTH = 80
 GLYPH_HEIGHT = 99
 SEGMENT_COUNT = 47
 BAUD_DELAY = 1 / 60
+TILE_CACHE_BYTES = 32 * 1024 * 1024  # finished slot tiles kept around for reuse
+DISPLAY_MODE = "framebuffer"  # or "slots" for one canvas image + text item per slot
+DEBUG_OVERLAY = True  # slot index + segment list drawn over each slot
 
 # ─────────────────────────────────────────────
 # STATE
-glyph_buffer = []
+glyph_buffer = GlyphBuffer()  # back buffer, written by handle_byte
+front_buffer = GlyphBuffer()  # last committed frame, read by render_display
 current_index = 0
 mode = "SEG"
 frame_count = 0
@@ -24,105 +34,80 @@ user_selected_color = (0, 255, 0)  # bright green
 
 # ─────────────────────────────────────────────
 # IMAGE LOADING
-segment_images = {}
+segment_sprites = {}
 for i in range(SEGMENT_COUNT):
     try:
-        img = Image.open(f"segments/{i}.png").resize((GLYPH_WIDTH, GLYPH_HEIGHT), Image.Resampling.LANCZOS)
-        segment_images[i] = img.convert("RGBA")
+        segment_sprites[i] = open_sprite(f"segments/{i}.png", (GLYPH_WIDTH, GLYPH_HEIGHT))
     except Exception as e:
         print(f"[ERROR] Failed to load segment {i}: {e}")
+renderer = Renderer(GRID_COLS, GRID_ROWS, GLYPH_WIDTH, GLYPH_HEIGHT,
+                    segment_images=segment_sprites, tile_cache_bytes=TILE_CACHE_BYTES)
 
 # ─────────────────────────────────────────────
 # COLOR LOGIC
 def get_segment_color(i):
-    global frame_count
-    if segment_color_mode == "static":
-        return user_selected_color
-    elif segment_color_mode == "rainbow":
-        hue = ((i * 10 + frame_count * 5) % 360) / 360
-        r, g, b = colorsys.hsv_to_rgb(hue, 1, 1)
-        return int(r * 255), int(g * 255), int(b * 255)
-    elif segment_color_mode == "trans":
-        palette = [(173,216,230), (255,182,193), (255,255,255)]
-        return palette[(i + frame_count) % len(palette)]
-
-def colorize_segment(img, rgb):
-    gray = ImageOps.grayscale(img)
-    colored = ImageOps.colorize(gray, black="black", white=rgb)
-    return colored.convert("RGBA")
+    return segment_color(i, segment_color_mode, user_selected_color, frame_count)
 
 # ─────────────────────────────────────────────
 # BUFFER INIT
 def init_buffer(cols, rows):
-    global glyph_buffer
-    glyph_buffer = [set() for _ in range(cols * rows)]
+    glyph_buffer.resize(cols * rows)
+    front_buffer.resize(cols * rows)
 
 # ─────────────────────────────────────────────
 # BYTE PARSER
 def handle_byte(b, glyph_map=None):
     global current_index, mode, frame_count, segment_color_mode, user_selected_color
+    if trace.level >= trace.BYTE:
+        trace.record("PARSER", b, slot=current_index, mode=mode)
 
     if b == 0x01: current_index = 0
     elif b == 0x02: mode = "CHAR"
-    elif b == 0x03: frame_count += 1; return "RENDER"
-    elif b == 0x04: return "RENDER"
+    elif b == 0x03: frame_count += 1; glyph_buffer.commit(front_buffer); return "RENDER"
+    elif b == 0x04: glyph_buffer.commit(front_buffer); return "RENDER"
     elif b == 0x05: mode = "SEG"
-    elif b == 0x08: glyph_buffer[current_index].clear()
+    elif b == 0x08: glyph_buffer.set_mask(current_index, 0)
     elif b == 0x09: return "BAUD"
     elif b == 0x0A: current_index = (current_index + 1) % len(glyph_buffer)
     elif b == 0x0D: current_index = 0
     elif b == 0x0F: segment_color_mode = "rainbow" if segment_color_mode == "static" else "static"
     elif b == 0x1B: mode = "SEG" if mode == "CHAR" else "CHAR"
-    elif b == 0x7F: [slot.clear() for slot in glyph_buffer]
+    elif b == 0x7F: glyph_buffer.clear_all()
     else:
         if mode == "SEG" and 33 <= b <= 79:
             seg_id = b - 33
-            glyph_buffer[current_index].add(seg_id)
+            glyph_buffer.set_mask(current_index, glyph_buffer.masks[current_index] | (1 << seg_id))
         elif mode == "CHAR" and glyph_map:
-            char = chr(b)
-            segments = glyph_map.get(char)
-            if segments:
-                glyph_buffer[current_index] = set(segments)
+            glyph = glyph_table(glyph_map).lookup(b)
+            if glyph:
+                glyph_buffer.set_mask(current_index, glyph)
                 current_index = (current_index + 1) % len(glyph_buffer)
     return None
 
 # ─────────────────────────────────────────────
 # DISPLAY SETUP
 canvas = None
-slot_images = []
+slot_canvas = None
 
 def render_display():
-    global canvas, slot_images
-    canvas.delete("all")
-
-    for idx, segments in enumerate(glyph_buffer):
-        x = (idx % GRID_COLS) * GLYPH_WIDTH
-        y = (idx // GRID_COLS) * GLYPH_HEIGHT
-        base = Image.new("RGBA", (GLYPH_WIDTH, GLYPH_HEIGHT), (0, 0, 0, 255))
-
-        for i in range(39, 47):
-            if i in segments:
-                faded = segment_images[i].copy()
-                faded.putalpha(30)
-                base.alpha_composite(faded)
-
-        for i in segments:
-            if i < 39:
-                rgb = get_segment_color(i)
-                colored = colorize_segment(segment_images[i], rgb)
-                base.alpha_composite(colored)
-
+    renderer.set_colors(segment_color_mode, user_selected_color, frame_count)
+    color_state = (segment_color_mode, user_selected_color)
+    pending = slot_canvas.pending_slots(front_buffer, color_state, renderer.animated)
+    tiles = renderer.slot_tiles(front_buffer, pending)
+    for idx in sorted(pending):
+        segments = front_buffer[idx]
+        slot_text = f"{idx}\n{sorted(list(segments))}" if DEBUG_OVERLAY else None
         try:
-            slot_images[idx] = ImageTk.PhotoImage(base)
-            canvas.create_image(x, y, anchor="nw", image=slot_images[idx])
+            slot_canvas.update_slot(idx, tiles[idx], slot_text)
         except RuntimeError as e:
             print(f"[RENDER ERROR] Skipped slot {idx}: {e}")
+            trace.record("RENDER", slot=idx, note=f"skipped: {e}")
+    slot_canvas.present()
 
-        slot_text = f"{idx}\n{sorted(list(segments))}"
-        canvas.create_text(x + 5, y + 5, anchor="nw", text=slot_text, fill="white", font=("Courier", 8))
+scheduler = None
 
 def launch_display():
-    global canvas, slot_images
+    global canvas, slot_canvas, scheduler
     init_buffer(GRID_COLS, GRID_ROWS)
     print(f"[DISPLAY INIT] glyph_buffer size: {len(glyph_buffer)}")
 
@@ -130,20 +115,41 @@ def launch_display():
     root.title("Segmented Display Simulator")
     canvas = tk.Canvas(root, width=GRID_COLS * GLYPH_WIDTH, height=GRID_ROWS * GLYPH_HEIGHT, bg="black")
     canvas.pack()
-    slot_images = [None] * (GRID_COLS * GRID_ROWS)
+    canvas_type = FrameCanvas if DISPLAY_MODE == "framebuffer" else SlotCanvas
+    slot_canvas = canvas_type(canvas, GRID_COLS, GRID_ROWS, GLYPH_WIDTH, GLYPH_HEIGHT)
 
     # Launch console window from inside the main GUI thread
     launch_console(root)
 
-    def tick():
+    def present():
         global frame_count
         frame_count += 1
         render_display()
-        root.after(int(BAUD_DELAY * 1000), tick)
 
-    tick()
+    # Presents on commits, on changed slots, and every tick while a color mode animates
+    scheduler = FrameScheduler(root.after, decode, present, BAUD_DELAY,
+                               idle_check=lambda: bool(front_buffer.dirty) or get_mode(segment_color_mode).animated)
+    scheduler.start()
     root.mainloop()
 
+def decode(chunk):
+    events = []
+    colors = (segment_color_mode, user_selected_color)
+    try:
+        for pos, b in enumerate(chunk):
+            result = handle_byte(b)
+            if result:
+                events.append((pos, result))
+                if trace.level >= trace.INFO:
+                    trace.record("DISPATCH", b, result, current_index, mode, f"frame {frame_count}")
+    except Exception:
+        trace.dump()
+        raise
+    if (segment_color_mode, user_selected_color) != colors:
+        # 0x0F changed the colors; rainbow -> static stops the animated ticks, so ask for a frame
+        scheduler.request_frame()
+    return events
+
 
 # ─────────────────────────────────────────────
 # CONSOLE GUI
@@ -161,9 +167,7 @@ def launch_console(root):
             for char in text:
                 b = ord(char)
                 print(f"[CONSOLE] Sending: {char} ({b})")
-                result = handle_byte(b)
-                if result == "RENDER":
-                    print(f"[DISPLAY] Rendering frame {frame_count}")
+                scheduler.feed(bytes([b]))
             input_var.set("")
 
     send_button = tk.Button(console, text="Send", command=send_char)
@@ -187,16 +191,31 @@ def launch_console(root):
         label = selected_code.get()
         b = control_codes[label]
         print(f"[CONSOLE] Sending control: {label} ({b})")
-        result = handle_byte(b)
-        if result == "RENDER":
-            print(f"[DISPLAY] Rendering frame {frame_count}")
+        scheduler.feed(bytes([b]))
 
     control_button = tk.Button(console, text="Send Control Code", command=send_control)
     control_button.grid(row=1, column=1, padx=5)
 
+    load_button = tk.Button(console, text="Load .bin", command=lambda: load_bin(root, scheduler))
+    load_button.grid(row=4, column=0, columnspan=2, pady=5)
+
     color_button = tk.Button(console, text="Set Color (soon)", state="disabled")
     color_button.grid(row=2, column=0, columnspan=2, pady=10)
 
+    # Tracing: BYTE keeps every parsed byte in the ring, dump prints it
+    trace_level = tk.StringVar(value=trace.LEVEL_NAMES[trace.level])
+    levels = {name: value for value, name in trace.LEVEL_NAMES.items()}
+    trace_menu = tk.OptionMenu(console, trace_level, *levels.keys(),
+                               command=lambda name: trace.set_level(levels[name]))
+    trace_menu.grid(row=3, column=0, padx=10, pady=5)
+
+    def dump():
+        trace.dump(sys.stdout)
+        print(f"[SCHEDULER] {scheduler.stats()}")
+
+    dump_button = tk.Button(console, text="Dump Trace", command=dump)
+    dump_button.grid(row=3, column=1, padx=5)
+
 # ─────────────────────────────────────────────
 # ENTRY POINT
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
+import os
 import tkinter as tk
-from PIL import Image, ImageTk, ImageOps
-import time, colorsys
-from pekseg_parser import glyph_buffer, init_buffer, handle_byte
+from pekseg_parser import GlyphBuffer, default_device, load_glyph_map
+from pekseg_canvas import SlotCanvas, FrameCanvas
+from pekseg_render import Renderer, segment_color
+from pekseg_scheduler import FrameScheduler
+from pekseg_persistence import Persistence
+import pekseg_trace as trace
 
 # Config
 GRID_COLS = 12
@@ -10,88 +14,138 @@ GLYPH_WIDTH = 80
 GLYPH_HEIGHT = 99
 SEGMENT_COUNT = 47
 BAUD_DELAY = 1 / 60
+TILE_CACHE_BYTES = 32 * 1024 * 1024  # finished slot tiles kept around for reuse
+DISPLAY_MODE = "framebuffer"  # or "slots" for one canvas image + text item per slot
+DEBUG_OVERLAY = True  # slot index + segment list drawn over each slot
+COMPOSITOR = "pil"  # "numpy" composites every changed slot in one batch (needs numpy)
+GLYPH_MAP_FILE = "glyph_map.json"  # characters for CHAR mode, compiled once at startup
+INGEST_POLL_MS = 5  # how often the Tk thread picks up frames from a live source
+INGEST_BACKLOG = 64 * 1024  # local bytes queued on the ingest thread before Load .bin waits
+PERSISTENCE_HALF_LIFE = 0  # seconds; > 0 lets segments fade out like phosphor instead of snapping off
 
-# State
-frame_count = 0
-segment_color_mode = "static"
-user_selected_color = (255, 255, 255)
+# State lives on the PeksegDevice a display draws: pekseg_parser's
+# default_device unless launch_display() is handed another one
 
-# Load segment images
-segment_images = {}
-for i in range(SEGMENT_COUNT):
-    img = Image.open(f"segments/{i}.png").resize((GLYPH_WIDTH, GLYPH_HEIGHT), Image.Resampling.LANCZOS)
-    segment_images[i] = img.convert("RGBA")
+# Load segment images; compositing, colors and caches live in the renderer
+renderer = Renderer(GRID_COLS, GRID_ROWS, GLYPH_WIDTH, GLYPH_HEIGHT,
+                    compositor=COMPOSITOR, tile_cache_bytes=TILE_CACHE_BYTES)
+segment_sprites = renderer.sprites
+glyph_map = load_glyph_map(GLYPH_MAP_FILE) if os.path.exists(GLYPH_MAP_FILE) else None
 
 # Color logic
-def get_segment_color(i):
-    global frame_count
-    if segment_color_mode == "static":
-        return user_selected_color
-    elif segment_color_mode == "rainbow":
-        hue = ((i * 10 + frame_count * 5) % 360) / 360
-        r, g, b = colorsys.hsv_to_rgb(hue, 1, 1)
-        return int(r * 255), int(g * 255), int(b * 255)
-    elif segment_color_mode == "trans":
-        palette = [(173,216,230), (255,182,193), (255,255,255)]
-        return palette[(i + frame_count) % len(palette)]
-
-def colorize_segment(img, rgb):
-    gray = ImageOps.grayscale(img)
-    colored = ImageOps.colorize(gray, black="black", white=rgb)
-    return colored.convert("RGBA")
+def get_segment_color(i, device=default_device):
+    return segment_color(i, device.segment_color_mode, device.user_selected_color, device.commits)
 
 # GUI setup
-def launch_display():
-    init_buffer(GRID_COLS, GRID_ROWS)
-    print(f"[DISPLAY INIT] glyph_buffer size: {len(glyph_buffer)}")  # Should be 108
-    root = tk.Tk()
-    root.title("PEKSEG Display")
-    canvas = tk.Canvas(root, width=GRID_COLS * GLYPH_WIDTH, height=GRID_ROWS * GLYPH_HEIGHT, bg="black")
+def launch_display(source=None, device=None, root=None):
+    """Open a display window for one device and return (dispatch, root).
+
+    source: optional serial/pty path or socket URL, see pekseg_ingest.
+    device: the PeksegDevice to parse into and draw, default_device if None.
+    root: an existing Tk root to open this display as a Toplevel of, so one
+    process can show several panels side by side.
+    """
+    device = device or default_device
+    if device.glyph_map is None:
+        device.glyph_map = glyph_map
+    device.init_buffer(GRID_COLS, GRID_ROWS)
+    print(f"[DISPLAY INIT] glyph_buffer size: {len(device.glyph_buffer)}")  # Should be 108
+    if root is None:
+        root = window = tk.Tk()
+    else:
+        window = tk.Toplevel(root)
+    window.title(f"PEKSEG Display {device.name}" if device.name else "PEKSEG Display")
+    canvas = tk.Canvas(window, width=GRID_COLS * GLYPH_WIDTH, height=GRID_ROWS * GLYPH_HEIGHT, bg="black")
     canvas.pack()
-    slot_images = [None] * (GRID_COLS * GRID_ROWS)
+    canvas_type = FrameCanvas if DISPLAY_MODE == "framebuffer" else SlotCanvas
+    slot_canvas = canvas_type(canvas, GRID_COLS, GRID_ROWS, GLYPH_WIDTH, GLYPH_HEIGHT)
+
+    # Only committed frames are drawn: the device's front buffer, or with a live
+    # source (parser on the ingest thread) a copy restored from each commit
+    shown = GlyphBuffer(len(device.glyph_buffer)) if source else device.front_buffer
+
+    persistence = Persistence(len(shown), PERSISTENCE_HALF_LIFE) if PERSISTENCE_HALF_LIFE > 0 else None
 
     def render_display():
-        canvas.delete("all")
-        for idx, segments in enumerate(glyph_buffer):
-            x = (idx % GRID_COLS) * GLYPH_WIDTH
-            y = (idx // GRID_COLS) * GLYPH_HEIGHT
-            base = Image.new("RGBA", (GLYPH_WIDTH, GLYPH_HEIGHT), (0, 0, 0, 255))
-
-            # Background pass
-            for i in range(39, 47):
-                if i in segments:
-                    faded = segment_images[i].copy()
-                    faded.putalpha(30)
-                    base.alpha_composite(faded)
-
-            # Foreground pass
-            for i in segments:
-                if i < 39:
-                    rgb = get_segment_color(i)
-                    colored = colorize_segment(segment_images[i], rgb)
-                    base.alpha_composite(colored)
-
-
-            slot_images[idx] = ImageTk.PhotoImage(base)
-            canvas.create_image(x, y, anchor="nw", image=slot_images[idx])
+        # Only slots that changed since the last frame get recomposited
+        color_mode, color = device.segment_color_mode, device.user_selected_color
+        renderer.set_colors(color_mode, color, device.commits)
+        pending = slot_canvas.pending_slots(shown, (color_mode, color), renderer.animated)
+        glowing = []
+        if persistence is not None:
+            # Plus whatever is still fading; those get drawn at their current intensity
+            pending = set(pending) | set(persistence.update(shown.masks, pending))
+            glowing = [idx for idx in pending if persistence.fading[idx]]
+        tiles = renderer.slot_tiles(shown, pending.difference(glowing))
+        if glowing:
+            tiles.update(renderer.glow_tiles(shown, glowing, persistence.intensity))
+
+        for idx in sorted(pending):
+            segments = shown[idx]
             # Overlay slot index and active segments
-            slot_text = f"{idx}\n{sorted(list(segments))}"
-            canvas.create_text(x + 5, y + 5, anchor="nw", text=slot_text, fill="white", font=("Courier", 8))
+            slot_text = f"{idx}\n{sorted(list(segments))}" if DEBUG_OVERLAY else None
+            slot_canvas.update_slot(idx, tiles[idx], slot_text)
+        slot_canvas.present()
+
+    worker = None  # IngestWorker when a live source is attached; it owns the device then
 
+    def decode(chunk):
+        if worker is not None:
+            # Parsing on this thread would race the ingest thread; queue it there.
+            # Frames come back through pump() like the source's own.
+            if worker.submit(chunk) is None:
+                print(f"[DISPLAY] ingest stopped ({worker.error}), dropped {len(chunk)} bytes")
+            return []
+        try:
+            events = device.handle_bytes(chunk)
+        except Exception:
+            trace.dump()
+            raise
+        if trace.level >= trace.DEBUG:
+            trace.record("DECODE", note=f"{len(chunk)} bytes, {len(events)} events")
+        return events
 
-        root.update()
+    def present():
+        if trace.level >= trace.INFO:
+            trace.record("DISPLAY", note=f"frame {device.commits}, {scheduler.dropped} dropped so far")
+        render_display()
+
+    # Commits are presented on the scheduler's clock; BAUD pacing delays the
+    # rest of the input instead of sleeping on the Tk thread
+    scheduler = FrameScheduler(window.after, decode, present, BAUD_DELAY,
+                               idle_check=lambda: persistence is not None and persistence.active)
+    scheduler.start()
 
     def dispatch(b):
-        global frame_count
-        print(f"[DISPATCH] Byte received: {b}")
-        result = handle_byte(b)
-        print(f"[DISPATCH] Parser returned: {result}")
-        if result == "RENDER":
-            frame_count += 1
-            print(f"[DISPLAY] Rendering frame {frame_count}")
-            render_display()
-        elif result == "BAUD":
-            print("[DISPLAY] Baud pacing triggered")
-            time.sleep(BAUD_DELAY)
+        if trace.level >= trace.BYTE:
+            trace.record("DISPATCH", b, note="received")
+        scheduler.feed(bytes([b]))
+
+    dispatch.bytes = scheduler.feed
+    dispatch.scheduler = scheduler
+    dispatch.device = device
+    dispatch.ingest = None
+    # Whether bulk input (Load .bin) can hand over more; with a source that
+    # means the worker has caught up with what was submitted already
+    dispatch.ready = lambda: worker is None or worker.backlog < INGEST_BACKLOG
+
+    if source:
+        from pekseg_ingest import IngestWorker
+        worker = IngestWorker(source, parser=device).start()
+
+        last_frame = 0
+
+        def pump():
+            nonlocal last_frame
+            latest = worker.latest()
+            if latest is not None:
+                frame_number, snapshot = latest
+                shown.restore(snapshot)
+                # Snapshots skipped by latest() still count as dropped frames
+                scheduler.request_frame(frame_number - last_frame)
+                last_frame = frame_number
+            window.after(INGEST_POLL_MS, pump)
 
+        pump()
+        dispatch.ingest = worker
     return dispatch, root
@@ -0,0 +1,342 @@
+# pekseg_encoder.py
+from pekseg_parser import (MASK_BYTES, OP_DATA, OPCODE_TABLE, GlyphBuffer, PeksegDevice, glyph_table,
+                           mask_of, scroll_masks, segments_of)
+
+# ─────────────────────────────────────────────
+# BLOCK OP ENCODER
+# Builds byte streams out of the 0x80..0x84 block ops and the 0x85..0x87
+# slot attribute ops (see pekseg_parser).
+# A full frame costs at most 7 bytes per slot plus START and the commit.
+# Runs of equal slots, blank areas included, collapse into one 11-byte FILL,
+# and stretches that repeat earlier slots into one 7-byte COPY. Plain SEG
+# mode needs one byte per lit segment and a trip around the whole grid for
+# every extra segment in a slot. Marquees don't need frames at all: one
+# 3-byte SCROLL (or 9-byte SHIFT plus the new column) per step.
+START = 0x01
+RENDER = 0x03
+FLUSH = 0x04
+WRITE_SLOT = 0x80
+FILL = 0x81
+COPY = 0x82
+SCROLL = 0x83
+SHIFT = 0x84
+COLOR = 0x85
+FILL_COLOR = 0x86
+BRIGHTNESS = 0x87
+ALL_SEGMENTS = 255
+
+WRITE_COST = 1 + MASK_BYTES
+FILL_COST = 1 + 4 + MASK_BYTES
+COPY_COST = 1 + 6
+
+def encode_write(mask):
+    """Set the slot under the cursor to `mask` and advance."""
+    return bytes([WRITE_SLOT]) + mask.to_bytes(MASK_BYTES, "little")
+
+def encode_fill(start, count, mask):
+    """Set `count` slots from `start` to `mask`; cursor ends after them."""
+    return bytes([FILL]) + start.to_bytes(2, "little") + count.to_bytes(2, "little") + mask.to_bytes(MASK_BYTES, "little")
+
+def encode_copy(src, dst, count):
+    """Copy `count` slots from `src` to `dst`; cursor ends after the copy."""
+    return bytes([COPY]) + src.to_bytes(2, "little") + dst.to_bytes(2, "little") + count.to_bytes(2, "little")
+
+def encode_scroll(dx=0, dy=0):
+    """Roll the grid dx columns right / dy rows down, wrapping around."""
+    return bytes([SCROLL]) + dx.to_bytes(1, "little", signed=True) + dy.to_bytes(1, "little", signed=True)
+
+def encode_shift(dx=0, dy=0, fill=0):
+    """Move the grid, filling the slots it leaves behind with `fill`."""
+    return (bytes([SHIFT]) + dx.to_bytes(1, "little", signed=True) + dy.to_bytes(1, "little", signed=True)
+            + fill.to_bytes(MASK_BYTES, "little"))
+
+def encode_color(rgb):
+    """Color the slot under the cursor; (0, 0, 0) hands it back to the color mode."""
+    return bytes([COLOR]) + bytes(rgb)
+
+def encode_fill_color(start, count, rgb):
+    """Color `count` slots from `start`; the cursor doesn't move."""
+    return bytes([FILL_COLOR]) + start.to_bytes(2, "little") + count.to_bytes(2, "little") + bytes(rgb)
+
+def encode_brightness(level, seg=ALL_SEGMENTS):
+    """Brightness 0..255 of one segment of the slot under the cursor, or all of them."""
+    return bytes([BRIGHTNESS, seg, level])
+
+def run_length(masks, start):
+    end = start + 1
+    while end < len(masks) and masks[end] == masks[start]:
+        end += 1
+    return end - start
+
+def longest_copy(masks, start, seen):
+    """Longest stretch at `start` that already appears earlier in the frame.
+
+    The source has to end before `start`, since slots from `start` on still
+    hold whatever the display had before this frame.
+    """
+    best_src, best_len = 0, 0
+    for src in seen.get(masks[start], ()):
+        length = 0
+        while (start + length < len(masks) and src + length < start
+               and masks[src + length] == masks[start + length]):
+            length += 1
+        if length > best_len:
+            best_src, best_len = src, length
+    return best_src, best_len
+
+def encode_frame(masks, commit=RENDER):
+    """Bytes that set every slot to `masks` and then commit.
+
+    masks is a list of slot masks or a GlyphBuffer. Each stretch of slots
+    goes out as whichever of WRITE / FILL / COPY covers the most slots per
+    byte. Pass commit=None to leave the frame uncommitted.
+    """
+    if isinstance(masks, GlyphBuffer):
+        masks = masks.masks
+    masks = list(masks)
+    out = bytearray([START])
+    seen = {}
+    idx = 0
+    while idx < len(masks):
+        run = run_length(masks, idx)
+        src, copied = longest_copy(masks, idx, seen)
+        if run > 1 and run / FILL_COST >= copied / COPY_COST:
+            out += encode_fill(idx, run, masks[idx])
+            covered = run
+        elif copied > 1:
+            out += encode_copy(src, idx, copied)
+            covered = copied
+        else:
+            out += encode_write(masks[idx])
+            covered = 1
+        for slot in range(idx, idx + covered):
+            seen.setdefault(masks[slot], []).append(slot)
+        idx += covered
+    if commit is not None:
+        out.append(commit)
+    return bytes(out)
+
+# ─────────────────────────────────────────────
+# FRAME DIFF ENCODER
+# Turns what a device holds now into a target frame with as few bytes as it
+# can find. The stream is one forward sweep over the slots, optionally after
+# a CLEAR ALL and/or a scroll, then zero or more extra SEG passes:
+#   - a slot that already matches costs 1 (NEXT SLOT)
+#   - a glyph in CHAR mode costs 1, a single missing segment in SEG mode 1,
+#     CLEAR SLOT + one segment 2, WRITE SLOT 7, a FILL over a run 11
+#   - SEG data lights a segment *and* advances, so a slot missing k segments
+#     takes one byte in the sweep and one in each of k - 1 extra passes
+#     (RESET SLOT, then one byte per slot up to the last one still missing
+#     something)
+# A dynamic program picks the cheapest option per slot, for each candidate
+# start (as is / CLEAR ALL / each scroll) and number of extra passes.
+CHAR_MODE = 0x02
+CLEAR_SLOT = 0x08
+NEXT_SLOT = 0x0A
+RESET_SLOT = 0x0D
+TOGGLE_MODE = 0x1B
+CLEAR_ALL = 0x7F
+
+MAX_EXTRA_PASSES = 4
+SCROLL_CANDIDATES = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+# Segment ids whose byte isn't a control byte, so SEG mode can send them
+ADDABLE = [seg for seg in range(47) if OPCODE_TABLE[seg] == OP_DATA]
+ADDABLE_MASK = mask_of(ADDABLE)
+
+def glyph_bytes(glyph_map):
+    """{mask: byte} for every glyph CHAR mode can draw with one data byte."""
+    table = glyph_table(glyph_map)
+    found = {}
+    if table is None:
+        return found
+    for b, mask in enumerate(table.dense):
+        if mask and OPCODE_TABLE[b] == OP_DATA and mask not in found:
+            found[mask] = b
+    return found
+
+def target_masks(target, slot_count, glyph_map=None, cols=0):
+    """A target frame as slot masks: a list of masks, a GlyphBuffer, or text.
+
+    Text goes through the glyph map in reading order; a newline moves to the
+    start of the next row, unmapped characters and the rest of the grid are
+    blank.
+    """
+    if isinstance(target, GlyphBuffer):
+        target = target.masks
+    if not isinstance(target, str):
+        masks = [int(mask) for mask in target][:slot_count]
+        return masks + [0] * (slot_count - len(masks))
+    table = glyph_table(glyph_map)
+    masks = [0] * slot_count
+    idx = 0
+    for char in target:
+        if char == "\n":
+            idx = (idx // cols + 1) * cols if cols else idx
+            continue
+        if idx >= slot_count:
+            break
+        masks[idx] = table.lookup(char) if table else 0
+        idx += 1
+    return masks
+
+def plan_sweep(base, target, glyphs, passes, start_mode):
+    """Cheapest forward sweep from slot 0. Returns (cost, steps, end_mode).
+
+    cost counts the sweep plus the mode toggle the extra passes would need,
+    not the passes themselves. Each step is (slot, kind, mode_after, extra)
+    where extra holds segments left for the extra passes.
+    """
+    n = len(target)
+    last = max((idx for idx in range(n) if base[idx] != target[idx]), default=-1)
+    runs = [1] * n
+    for idx in range(n - 2, -1, -1):
+        if target[idx] == target[idx + 1]:
+            runs[idx] = runs[idx + 1] + 1
+
+    # best[i][m]: (cost to finish from cursor i in mode m, choice); m 0 = SEG, 1 = CHAR
+    best = [[None, None] for _ in range(n + 1)]
+    for idx in range(n, -1, -1):
+        for mode in (0, 1):
+            if idx > last:
+                best[idx][mode] = ((1 if passes and mode else 0), None)
+                continue
+            have, want = base[idx], target[idx]
+            toggle_seg = 1 if mode else 0
+            toggle_char = 0 if mode else 1
+            options = []
+            if have == want:
+                options.append((1 + best[idx + 1][mode][0], ("next", mode, 1)))
+            options.append((WRITE_COST + best[idx + 1][mode][0], ("write", mode, 1)))
+            if want in glyphs:
+                options.append((toggle_char + 1 + best[idx + 1][1][0], ("char", 1, 1)))
+            missing = want & ~have
+            if want & have == have and missing and missing & ~ADDABLE_MASK == 0 \
+                    and bin(missing).count("1") - 1 <= passes:
+                options.append((toggle_seg + 1 + best[idx + 1][0][0], ("add", 0, 1)))
+            if want and have and want & ~ADDABLE_MASK == 0 and bin(want).count("1") - 1 <= passes:
+                options.append((toggle_seg + 2 + best[idx + 1][0][0], ("clear_add", 0, 1)))
+            if not want and have:
+                options.append((2 + best[idx + 1][mode][0], ("clear", mode, 1)))
+            run = runs[idx]
+            if run > 1:
+                options.append((FILL_COST + best[idx + run][mode][0], ("fill", mode, run)))
+            best[idx][mode] = min(options, key=lambda option: option[0])
+
+    steps = []
+    mode = start_mode
+    idx = 0
+    while idx <= last:
+        kind, mode_after, covered = best[idx][mode][1]
+        steps.append((idx, kind, mode, mode_after, covered))
+        mode = mode_after
+        idx += covered
+    return best[0][start_mode][0], steps, mode
+
+def emit_sweep(steps, base, target, glyphs):
+    out = bytearray()
+    leftovers = {}
+    for idx, kind, mode, mode_after, covered in steps:
+        if kind in ("char", "add", "clear_add") and mode != mode_after:
+            out.append(TOGGLE_MODE)
+        if kind == "next":
+            out.append(NEXT_SLOT)
+        elif kind == "write":
+            out += encode_write(target[idx])
+        elif kind == "char":
+            out.append(glyphs[target[idx]])
+        elif kind == "clear":
+            out += bytes([CLEAR_SLOT, NEXT_SLOT])
+        elif kind == "fill":
+            out += encode_fill(idx, covered, target[idx])
+        else:
+            if kind == "clear_add":
+                out.append(CLEAR_SLOT)
+                segments = segments_of(target[idx])
+            else:
+                segments = segments_of(target[idx] & ~base[idx])
+            out.append(segments[0])
+            if segments[1:]:
+                leftovers[idx] = segments[1:]
+    return out, leftovers
+
+def emit_passes(leftovers, end_mode):
+    out = bytearray()
+    if not leftovers:
+        return out
+    if end_mode:
+        out.append(TOGGLE_MODE)
+    for round_ in range(max(len(segments) for segments in leftovers.values())):
+        last = max(idx for idx, segments in leftovers.items() if len(segments) > round_)
+        out.append(RESET_SLOT)
+        for idx in range(last + 1):
+            segments = leftovers.get(idx, ())
+            out.append(segments[round_] if len(segments) > round_ else NEXT_SLOT)
+    return out
+
+def encode_diff(current, target, cursor=0, mode="SEG", glyph_map=None, cols=0, commit=RENDER):
+    """Shortest stream found that turns `current` into `target`, then commits.
+
+    current is a PeksegDevice (its back buffer, cursor, mode, glyph map and
+    width are used) or a list of slot masks. target is a list of masks, a
+    GlyphBuffer, or text (see target_masks).
+    """
+    if isinstance(current, PeksegDevice):
+        device = current
+        current = list(device.glyph_buffer.masks)
+        cursor, mode = device.current_index, device.mode
+        glyph_map = glyph_map or device.glyph_map
+        cols = cols or device.cols
+    current = list(current)
+    target = target_masks(target, len(current), glyph_map, cols)
+    glyphs = glyph_bytes(glyph_map)
+    start_mode = 1 if mode == "CHAR" else 0
+
+    prefixes = [(b"", current), (bytes([CLEAR_ALL]), [0] * len(current))]
+    if cols:
+        for dx, dy in SCROLL_CANDIDATES:
+            prefixes.append((encode_scroll(dx, dy), scroll_masks(current, cols, dx, dy)))
+
+    best = None
+    for prefix, base in prefixes:
+        for passes in range(MAX_EXTRA_PASSES + 1):
+            _, steps, end_mode = plan_sweep(base, target, glyphs, passes, start_mode)
+            sweep, leftovers = emit_sweep(steps, base, target, glyphs)
+            out = bytearray(prefix)
+            # The sweep starts at slot 0. If the cursor sits somewhere the
+            # sweep only NEXTs past anyway, start from there instead of START
+            skipped = [step for step in steps if step[0] < cursor]
+            if cursor and steps and (len(skipped) < cursor or any(step[1] != "next" for step in skipped)):
+                out.append(START)
+                out += sweep
+            else:
+                out += sweep[len(skipped):]
+            out += emit_passes(leftovers, end_mode)
+            if best is None or len(out) < len(best):
+                best = out
+    if commit is not None:
+        best.append(commit)
+    return bytes(best)
+
+def encode_sequence(frames, device=None, glyph_map=None, cols=12, rows=9, commit=RENDER):
+    """encode_diff() for each frame in turn, one byte string per frame.
+
+    Runs every piece through a scratch PeksegDevice so the next diff starts
+    from exactly what the display will hold. device (left untouched) gives
+    the starting state; without one the display starts blank at slot 0.
+    """
+    if device is None:
+        scratch = PeksegDevice(cols, rows, glyph_map, name="encoder")
+    else:
+        scratch = PeksegDevice(device.cols, device.rows, glyph_map or device.glyph_map, name="encoder")
+        # Masks and slot attributes both, so attribute ops diff against the real state
+        snapshot = device.glyph_buffer.snapshot()
+        scratch.glyph_buffer.restore(snapshot)
+        scratch.front_buffer.restore(snapshot)
+        scratch.current_index, scratch.mode = device.current_index, device.mode
+    pieces = []
+    for frame in frames:
+        piece = encode_diff(scratch, frame, commit=commit)
+        scratch.handle_bytes(piece)
+        pieces.append(piece)
+    return pieces
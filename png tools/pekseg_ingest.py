@@ -0,0 +1,253 @@
+# pekseg_ingest.py
+import asyncio
+import os
+import pty
+import queue
+import termios
+import threading
+import tty
+from urllib.parse import urlparse
+
+import pekseg_parser
+import pekseg_trace as trace
+from pekseg_parser import COMMIT_BYTES, is_commit
+
+# ─────────────────────────────────────────────
+# ASYNC INGESTION
+# Reads a byte stream in big chunks on a worker thread, runs it through the
+# bulk parser and hands finished frames to the UI through a bounded queue.
+# When the queue is full the reader stops reading, so a fast producer gets
+# pushed back on (TCP window / tty buffer) instead of piling up frames here.
+#
+# Sources:
+#   /dev/ttyUSB0, /dev/pts/3      serial device or pty (raw mode, optional ?baud=)
+#   tcp://host:port               connect to a producer
+#   tcp-listen://host:port        accept producers, one after another
+#   unix:///path/to.sock          connect over a Unix socket
+#   unix-listen:///path/to.sock   accept producers on a Unix socket
+CHUNK_SIZE = 64 * 1024
+FRAME_QUEUE_SIZE = 8
+BACKPRESSURE_POLL = 0.005  # seconds between retries while the frame queue is full
+
+BAUD_RATES = {rate: getattr(termios, f"B{rate}") for rate in
+              (9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600) if hasattr(termios, f"B{rate}")}
+
+async def open_device(path, baud=None):
+    """Raw, non-blocking reader for a tty/pty path, no pyserial needed."""
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK | os.O_NOCTTY)
+    if os.isatty(fd):
+        tty.setraw(fd)
+        if baud:
+            attrs = termios.tcgetattr(fd)
+            attrs[4] = attrs[5] = BAUD_RATES[baud]
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=CHUNK_SIZE)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0))
+    return reader
+
+async def iter_readers(spec):
+    """Yield one StreamReader per connection described by `spec`."""
+    url = urlparse(spec)
+    if url.scheme in ("", "file", "serial"):
+        baud = None
+        if url.query.startswith("baud="):
+            baud = int(url.query[5:])
+        yield await open_device(url.path, baud)
+    elif url.scheme in ("tcp", "unix"):
+        if url.scheme == "tcp":
+            reader, writer = await asyncio.open_connection(url.hostname, url.port, limit=CHUNK_SIZE)
+        else:
+            reader, writer = await asyncio.open_unix_connection(url.path, limit=CHUNK_SIZE)
+        try:
+            yield reader
+        finally:
+            writer.close()
+    elif url.scheme in ("tcp-listen", "unix-listen"):
+        connections = asyncio.Queue()
+        on_connect = lambda reader, writer: connections.put_nowait((reader, writer))
+        if url.scheme == "tcp-listen":
+            server = await asyncio.start_server(on_connect, url.hostname, url.port, limit=CHUNK_SIZE)
+        else:
+            server = await asyncio.start_unix_server(on_connect, url.path, limit=CHUNK_SIZE)
+        async with server:
+            while True:
+                reader, writer = await connections.get()
+                try:
+                    yield reader
+                finally:
+                    writer.close()
+    else:
+        raise ValueError(f"unknown source: {spec}")
+
+class IngestWorker:
+    """Background thread: source -> parser.handle_bytes() -> frame queue.
+
+    parser is a PeksegDevice, or the pekseg_parser module for its default one.
+    `frames` holds (frame_number, snapshot) tuples, snapshot being
+    GlyphBuffer.snapshot() of the parser's front buffer after a commit. The
+    worker owns the parser it's given; nothing else should feed it bytes.
+    Input from other threads (console typing, Load .bin) goes through
+    submit(), anything else that changes the parser through apply(); both
+    run on the worker's loop, in order, between source chunks.
+    capture, if given, is a pekseg_capture.CaptureWriter that records every
+    chunk as it comes in.
+    """
+
+    def __init__(self, spec, parser=pekseg_parser, glyph_map=None, max_frames=FRAME_QUEUE_SIZE,
+                 chunk_size=CHUNK_SIZE, capture=None):
+        self.spec = spec
+        self.parser = parser
+        self.glyph_map = glyph_map
+        self.chunk_size = chunk_size
+        self.capture = capture
+        self.frames = queue.Queue(max_frames)
+        self.bytes_in = 0
+        self.frames_out = 0
+        # Bytes handed to submit() / fed from it; one writer each, so no lock
+        self.submitted = 0
+        self.submitted_fed = 0
+        self.error = None
+        self.loop = None
+        self.lock = None
+        self.thread = None
+        self.task = None
+        self.stopping = False
+
+    def start(self):
+        # Made here rather than on the thread, so submit() works right away
+        self.loop = asyncio.new_event_loop()
+        self.lock = asyncio.Lock()
+        self.thread = threading.Thread(target=self._run, name="pekseg-ingest", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._shutdown)
+            except RuntimeError:
+                pass  # loop already closed (the source failed)
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+
+    def _shutdown(self):
+        self.stopping = True
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        else:
+            self.loop.stop()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.task = self.loop.create_task(self.run())
+            self.loop.run_until_complete(self.task)
+            # Source ran out (e.g. the peer closed); keep serving submit()/apply() until stop()
+            if not self.stopping:
+                self.loop.run_forever()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.error = e
+            print(f"[INGEST] {self.spec}: {e}")
+            trace.dump()
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    async def run(self):
+        async for reader in iter_readers(self.spec):
+            while True:
+                chunk = await reader.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.bytes_in += len(chunk)
+                if self.capture is not None:
+                    self.capture.write(chunk)
+                async with self.lock:
+                    await self.feed(chunk)
+
+    @property
+    def backlog(self):
+        """Bytes given to submit() that the parser hasn't seen yet."""
+        return self.submitted - self.submitted_fed
+
+    def submit(self, data):
+        """Feed bytes from another thread through the parser, after what's already queued.
+
+        Returns a concurrent Future, or None if the worker has died (the
+        input is dropped; see `error`).
+        """
+        data = bytes(data)
+
+        async def feed():
+            async with self.lock:
+                await self.feed(data)
+            self.submitted_fed += len(data)
+        return self._call(feed, len(data))
+
+    def apply(self, change):
+        """Run change(parser) on the worker thread between chunks, then publish its front buffer."""
+        async def run():
+            async with self.lock:
+                change(self.parser)
+                await self.push(self.parser.front_buffer.snapshot())
+        return self._call(run)
+
+    def _call(self, coro, size=0):
+        if self.loop is None or self.loop.is_closed():
+            return None
+        self.submitted += size
+        try:
+            return asyncio.run_coroutine_threadsafe(coro(), self.loop)
+        except RuntimeError:
+            # Closed between the check and the call
+            self.submitted -= size
+            return None
+
+    async def feed(self, chunk):
+        view = memoryview(chunk)
+        start = 0
+        for match in COMMIT_BYTES.finditer(view):
+            end = match.end()
+            events = self.parser.handle_bytes(view[start:end], self.glyph_map)
+            committed = is_commit(events, end - start)
+            start = end
+            if committed:
+                await self.push(self.parser.front_buffer.snapshot())
+        if start < len(view):
+            self.parser.handle_bytes(view[start:], self.glyph_map)
+
+    async def push(self, snapshot):
+        self.frames_out += 1
+        item = (self.frames_out, snapshot)
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:
+                # Backpressure: stop reading until the UI takes a frame
+                await asyncio.sleep(BACKPRESSURE_POLL)
+
+    def latest(self):
+        """Drain the queue and return the newest (frame_number, snapshot), or None."""
+        item = None
+        while True:
+            try:
+                item = self.frames.get_nowait()
+            except queue.Empty:
+                return item
+
+    def stats(self):
+        return {"bytes_in": self.bytes_in, "frames_out": self.frames_out, "queued": self.frames.qsize()}
+
+def open_pty():
+    """Local stand-in for a serial port: returns (writer_fd, device_path).
+
+    Point an IngestWorker at device_path and os.write() bytes into writer_fd.
+    """
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    return master, path
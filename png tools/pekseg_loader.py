@@ -0,0 +1,122 @@
+# pekseg_loader.py
+import mmap
+import os
+import time
+import tkinter as tk
+from tkinter import filedialog, ttk
+
+# ─────────────────────────────────────────────
+# .BIN LOADING
+# Load .bin used to f.read() the whole file and push every byte through in
+# the button callback, which froze the window until it was done. BinLoader
+# memory-maps the file instead and feeds it a chunk at a time from Tk
+# after() callbacks, giving the event loop back every few milliseconds.
+# Nothing is decoded faster than the scheduler takes it: while it's still
+# holding input back (BAUD pacing) the loader waits. The scheduler already
+# presents at most one frame per tick, so a file full of commits only shows
+# the newest frame each refresh.
+CHUNK_SIZE = 16 * 1024
+STEP_BUDGET = 0.008  # seconds of decoding per callback before yielding to Tk
+
+class BinLoader:
+    """Feeds a file into `feed` in chunks from `after` callbacks.
+
+    ready, if given, is checked before each chunk; returning False pauses
+    the loader until the next callback. on_progress(done, total) runs after
+    every step that fed something, on_done(cancelled) once at the end.
+    """
+
+    def __init__(self, path, feed, after, ready=None, on_progress=None, on_done=None,
+                 chunk_size=CHUNK_SIZE, budget=STEP_BUDGET, clock=time.monotonic):
+        self.path = path
+        self.feed = feed
+        self.after = after
+        self.ready = ready
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.chunk_size = chunk_size
+        self.budget = budget
+        self.clock = clock
+        self.size = os.path.getsize(path)
+        self.file = open(path, "rb")
+        # mmap can't map an empty file; there's nothing to feed anyway
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.pos = 0
+        self.cancelled = False
+        self.done = False
+
+    def start(self):
+        self.after(0, self._step)
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _step(self):
+        if self.done:
+            return
+        if self.cancelled or self.pos >= self.size:
+            self._finish()
+            return
+        start = self.pos
+        deadline = self.clock() + self.budget
+        while self.pos < self.size and self.clock() < deadline:
+            if self.ready is not None and not self.ready():
+                break
+            end = min(self.pos + self.chunk_size, self.size)
+            self.feed(self.map[self.pos:end])
+            self.pos = end
+        if self.on_progress and self.pos != start:
+            self.on_progress(self.pos, self.size)
+        self.after(1, self._step)
+
+    def _finish(self):
+        self.done = True
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+        if self.on_done:
+            self.on_done(self.cancelled)
+
+# ─────────────────────────────────────────────
+# PROGRESS WINDOW
+def load_bin(root, scheduler, path=None, ready=None):
+    """Ask for a .bin (unless given one), stream it into a FrameScheduler.
+
+    Shows a small window with a progress bar, how many frames were decoded
+    vs actually shown, and a Cancel button. ready, if given, is an extra
+    "can take more" check (e.g. a display's ingest thread catching up).
+    Returns the BinLoader, or None if the dialog was dismissed.
+    """
+    path = path or filedialog.askopenfilename(filetypes=[("Binary files", "*.bin")])
+    if not path:
+        return None
+
+    window = tk.Toplevel(root)
+    window.title(f"Loading {os.path.basename(path)}")
+    bar = ttk.Progressbar(window, length=300, mode="determinate")
+    bar.grid(row=0, column=0, columnspan=2, padx=10, pady=10)
+    status = tk.StringVar(value="starting...")
+    tk.Label(window, textvariable=status, font=("Courier", 10)).grid(row=1, column=0, padx=10, pady=5)
+    committed, presented = scheduler.committed, scheduler.presented
+
+    def on_progress(done, total):
+        bar["maximum"] = total
+        bar["value"] = done
+        frames = scheduler.committed - committed
+        shown = scheduler.presented - presented
+        status.set(f"{done / total:.0%}  {frames} frames decoded, {shown} shown")
+
+    def on_done(cancelled):
+        if cancelled:
+            scheduler.discard_input()  # the part of the last chunk still held back
+        print(f"[LOAD] {path}: {'cancelled' if cancelled else 'done'} at {loader.pos}/{loader.size} bytes")
+        window.destroy()
+
+    # Only hand over more once the scheduler has caught up (it may be pacing on BAUD)
+    loader = BinLoader(path, scheduler.feed, root.after,
+                       ready=lambda: not scheduler.pending_input and (ready is None or ready()),
+                       on_progress=on_progress, on_done=on_done)
+    tk.Button(window, text="Cancel", command=loader.cancel).grid(row=1, column=1, padx=10, pady=5)
+    window.protocol("WM_DELETE_WINDOW", loader.cancel)
+    return loader.start()
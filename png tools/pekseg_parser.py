@@ -1,55 +1,948 @@
 # pekseg_parser.py
+import json
+import re
+from array import array
+from operator import or_
+import numpy as np
+import pekseg_trace as trace
 
-glyph_buffer = []
-current_index = 0
-mode = "SEG"
-frame_count = 0
+# ─────────────────────────────────────────────
+# GLYPH BUFFER
+# One 64-bit mask per slot, bit i set = segment i lit. 47 segments fit with
+# room to spare, so a whole 12x9 frame is 864 bytes instead of 108 sets.
+def mask_of(segments):
+    mask = 0
+    for seg in segments:
+        mask |= 1 << seg
+    return mask
+
+def segments_of(mask):
+    segments = []
+    seg = 0
+    while mask:
+        if mask & 1:
+            segments.append(seg)
+        mask >>= 1
+        seg += 1
+    return segments
+
+def scroll_masks(masks, cols, dx, dy, fill=None, blank=0):
+    """Slot masks moved dx columns right and dy rows down, as a new list.
+
+    fill=None wraps whatever falls off one edge back in at the other;
+    otherwise the slots left behind get the `fill` mask. Works on any per-slot
+    list; `blank` is what the missing slots of a ragged last row read as.
+    """
+    count = len(masks)
+    cols = cols or count
+    rows = -(-count // cols)
+    out = [0] * count
+    for idx in range(count):
+        row, col = divmod(idx, cols)
+        src_row, src_col = row - dy, col - dx
+        if fill is None:
+            src = (src_row % rows) * cols + src_col % cols
+        elif 0 <= src_row < rows and 0 <= src_col < cols:
+            src = src_row * cols + src_col
+        else:
+            out[idx] = fill
+            continue
+        out[idx] = masks[src] if src < count else (blank if fill is None else fill)
+    return out
+
+# ─────────────────────────────────────────────
+# SLOT ATTRIBUTES
+# Next to the masks every slot has an RGB color (3 bytes, 0,0,0 = use the
+# color mode) and a brightness per segment (47 bytes, 255 = full). They live
+# in two bytearrays, rgb and levels, and follow their slot through COPY and
+# SCROLL/SHIFT. Decoding works on plain lists: colors as 0xRRGGBB ints and
+# levels as one 47-byte bytes object per slot.
+LEVEL_COUNT = 47
+FULL = 255
+FULL_LEVELS = bytes([FULL]) * LEVEL_COUNT
+SNAPSHOT_SLOT_BYTES = 8 + 3 + LEVEL_COUNT  # mask, rgb, levels
+
+def unpack_attrs(rgb, levels):
+    """Packed rgb/levels bytes -> (colors, levels) lists."""
+    colors = [int.from_bytes(rgb[i:i + 3], "big") for i in range(0, len(rgb), 3)]
+    return colors, [bytes(levels[i:i + LEVEL_COUNT]) for i in range(0, len(levels), LEVEL_COUNT)]
+
+def scroll_attrs(attrs, cols, dx, dy, wrap=True):
+    """scroll_masks() for a (colors, levels) pair; vacated slots go back to defaults."""
+    colors, levels = attrs
+    colors[:] = scroll_masks(colors, cols, dx, dy, None if wrap else 0)
+    levels[:] = scroll_masks(levels, cols, dx, dy, None if wrap else FULL_LEVELS, FULL_LEVELS)
+
+class SlotView:
+    """Set-like view of one slot so old `slot.add(i)` / `i in slot` code keeps working."""
+    __slots__ = ("_buf", "_idx")
+
+    def __init__(self, buf, idx):
+        self._buf = buf
+        self._idx = idx
+
+    @property
+    def mask(self):
+        return self._buf.masks[self._idx]
+
+    def __contains__(self, seg):
+        return 0 <= seg < 64 and (self.mask >> seg) & 1 == 1
+
+    def __iter__(self):
+        return iter(segments_of(self.mask))
+
+    def __len__(self):
+        return bin(self.mask).count("1")
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __eq__(self, other):
+        if isinstance(other, SlotView):
+            return self.mask == other.mask
+        if isinstance(other, (set, frozenset)):
+            return set(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"SlotView({segments_of(self.mask)})"
+
+    def add(self, seg):
+        self._buf.set_mask(self._idx, self.mask | (1 << seg))
+
+    def discard(self, seg):
+        self._buf.set_mask(self._idx, self.mask & ~(1 << seg))
+
+    def update(self, segments):
+        self._buf.set_mask(self._idx, self.mask | mask_of(segments))
+
+    def clear(self):
+        self._buf.set_mask(self._idx, 0)
+
+class GlyphBuffer:
+    """Slot masks in an array('Q'). Indexing gives a SlotView, assigning takes segments.
+
+    Every slot whose mask changes is added to `dirty` until the renderer calls
+    take_dirty(). Code that writes `masks` directly has to mark slots itself.
+    Scrolls are also logged in `scrolls` as (dx, dy, fill), so a renderer
+    can move pixels it already has instead of redrawing every slot.
+    Per-slot color and segment brightness are in `rgb` and `levels` (see
+    SLOT ATTRIBUTES); has_attrs stays False until one is set, so buffers that
+    never use them skip all of that work.
+    """
+
+    def __init__(self, count=0):
+        self.masks = array("Q", bytes(8 * count))
+        self.rgb = bytearray(3 * count)
+        self.levels = bytearray(FULL_LEVELS * count)
+        self.has_attrs = False
+        self.dirty = set(range(count))
+        self.scrolls = []
+
+    def resize(self, count):
+        # In place, so modules that did `from pekseg_parser import glyph_buffer` stay bound
+        self.masks[:] = array("Q", bytes(8 * count))
+        self.rgb[:] = bytes(3 * count)
+        self.levels[:] = FULL_LEVELS * count
+        self.has_attrs = False
+        self.dirty = set(range(count))
+        self.scrolls = []
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self.masks)
+        if not 0 <= idx < len(self.masks):
+            raise IndexError("slot index out of range")
+        return SlotView(self, idx)
+
+    def __setitem__(self, idx, segments):
+        self.set_mask(idx, segments if isinstance(segments, int) else mask_of(segments))
+
+    def __iter__(self):
+        return (SlotView(self, idx) for idx in range(len(self.masks)))
+
+    def __eq__(self, other):
+        if isinstance(other, GlyphBuffer):
+            return self.masks == other.masks
+        return NotImplemented
+
+    __hash__ = None
+
+    def set_mask(self, idx, mask):
+        if self.masks[idx] != mask:
+            self.masks[idx] = mask
+            self.dirty.add(idx)
+
+    def scroll(self, cols, dx, dy, fill=None):
+        """Move the grid dx columns / dy rows, wrapping (fill=None) or filling."""
+        masks = scroll_masks(self.masks, cols, dx, dy, fill)
+        for idx, (old, new) in enumerate(zip(self.masks, masks)):
+            if old != new:
+                self.dirty.add(idx)
+        self.masks[:] = array("Q", masks)
+        if self.has_attrs:
+            attrs = self.attr_lists()
+            scroll_attrs(attrs, cols, dx, dy, fill is None)
+            self.store_attrs(*attrs)
+        self.scrolls.append((dx, dy, fill))
+
+    def color(self, idx):
+        """The slot's own (r, g, b), or None if it follows the color mode."""
+        rgb = tuple(self.rgb[3 * idx:3 * idx + 3])
+        return rgb if any(rgb) else None
+
+    def set_color(self, idx, rgb):
+        packed = bytes(rgb or (0, 0, 0))
+        if self.rgb[3 * idx:3 * idx + 3] != packed:
+            self.rgb[3 * idx:3 * idx + 3] = packed
+            self.dirty.add(idx)
+            self.has_attrs = self.has_attrs or any(packed)
+
+    def attr_key(self, idx):
+        """Hashable attributes of one slot, None when it has the defaults."""
+        rgb = bytes(self.rgb[3 * idx:3 * idx + 3])
+        levels = bytes(self.levels[LEVEL_COUNT * idx:LEVEL_COUNT * (idx + 1)])
+        if rgb == b"\0\0\0" and levels == FULL_LEVELS:
+            return None
+        return rgb, levels
+
+    def attr_lists(self):
+        """(colors, levels) as decoding works on them, see SLOT ATTRIBUTES."""
+        return unpack_attrs(self.rgb, self.levels)
+
+    def store_attrs(self, colors, levels):
+        """Write attribute lists back, marking the slots whose attributes changed."""
+        rgb = b"".join(color.to_bytes(3, "big") for color in colors)
+        packed = b"".join(levels)
+        old_rgb, old_levels = self.rgb, self.levels
+        for idx in range(len(colors)):
+            lo, hi = LEVEL_COUNT * idx, LEVEL_COUNT * (idx + 1)
+            if rgb[3 * idx:3 * idx + 3] != old_rgb[3 * idx:3 * idx + 3] or packed[lo:hi] != old_levels[lo:hi]:
+                self.dirty.add(idx)
+        old_rgb[:] = rgb
+        old_levels[:] = packed
+        if not self.has_attrs:
+            self.has_attrs = any(colors) or any(level != FULL_LEVELS for level in levels)
+
+    def take_scrolls(self):
+        scrolls = self.scrolls
+        self.scrolls = []
+        return scrolls
+
+    def clear_all(self):
+        masks = self.masks
+        for idx in range(len(masks)):
+            if masks[idx]:
+                masks[idx] = 0
+                self.dirty.add(idx)
+
+    def commit(self, front):
+        """Publish this (back) buffer as the new front frame.
+
+        The two arrays swap places, so readers of `front` go from one whole
+        frame to the next in a single assignment and never see a half-written
+        one. Only the slots written since the last commit are then copied back,
+        so this buffer carries on from the frame it just published. Returns
+        those slots, which are also added to front.dirty.
+        """
+        changed = self.take_dirty()
+        if len(front.masks) != len(self.masks):
+            front.resize(len(self.masks))
+            changed = set(range(len(self.masks)))
+        self.masks, front.masks = front.masks, self.masks
+        masks, published = self.masks, front.masks
+        for idx in changed:
+            masks[idx] = published[idx]
+        if self.has_attrs or front.has_attrs:
+            self.rgb, front.rgb = front.rgb, self.rgb
+            self.levels, front.levels = front.levels, self.levels
+            for idx in changed:
+                self.rgb[3 * idx:3 * idx + 3] = front.rgb[3 * idx:3 * idx + 3]
+                lo, hi = LEVEL_COUNT * idx, LEVEL_COUNT * (idx + 1)
+                self.levels[lo:hi] = front.levels[lo:hi]
+            front.has_attrs = self.has_attrs
+        # New set instead of |=, so a take_dirty() racing this can't lose slots
+        front.dirty = front.dirty | changed
+        if self.scrolls:
+            front.scrolls = front.scrolls + self.scrolls
+            self.scrolls = []
+        return changed
+
+    def take_dirty(self):
+        """Return the slots changed since the last call and start a new set."""
+        dirty = self.dirty
+        self.dirty = set()
+        return dirty
+
+    def snapshot(self):
+        """Immutable, hashable copy of the whole frame: masks, then rgb, then levels."""
+        return self.masks.tobytes() + bytes(self.rgb) + bytes(self.levels)
+
+    def restore(self, snapshot):
+        """Load a snapshot() back in, marking only the slots that differ."""
+        count = len(snapshot) // SNAPSHOT_SLOT_BYTES
+        masks = array("Q")
+        masks.frombytes(snapshot[:8 * count])
+        if len(masks) != len(self.masks):
+            self.resize(len(masks))
+        for idx, (old, new) in enumerate(zip(self.masks, masks)):
+            if old != new:
+                self.dirty.add(idx)
+        self.masks[:] = masks
+        rgb = snapshot[8 * count:11 * count]
+        levels = snapshot[11 * count:]
+        plain = not any(rgb) and levels == FULL_LEVELS * count
+        if self.has_attrs or not plain:
+            self.store_attrs(*unpack_attrs(rgb, levels))
+            self.has_attrs = not plain
+
+    def diff(self, other):
+        """Slot indices whose masks differ from another buffer or snapshot."""
+        if isinstance(other, (bytes, bytearray)):
+            theirs = array("Q")
+            theirs.frombytes(other[:8 * len(self.masks)])
+        else:
+            theirs = other.masks
+        return [idx for idx, (a, b) in enumerate(zip(self.masks, theirs)) if a != b]
+
+# ─────────────────────────────────────────────
+# GLYPH TABLE
+# glyph_map.json compiled once into masks indexed by codepoint: a flat list
+# for 0..255 (everything a byte can be) and a dict for the rest of Unicode.
+# CHAR mode then does one list index per byte instead of chr() + dict lookup
+# + building a segment list. Characters mapped to no segments count as
+# unmapped, same as the `if segments:` check they replace.
+LATIN1 = 256
+
+class GlyphTable:
+    def __init__(self, glyph_map=None):
+        self.dense = [0] * LATIN1
+        self.sparse = {}
+        self._tables = None
+        for char, segments in (glyph_map or {}).items():
+            self.set(char, segments)
+
+    def set(self, char, segments):
+        code = ord(char) if isinstance(char, str) else char
+        mask = segments if isinstance(segments, int) else mask_of(segments)
+        self._tables = None
+        if code < LATIN1:
+            self.dense[code] = mask
+        elif mask:
+            self.sparse[code] = mask
+        else:
+            self.sparse.pop(code, None)
+
+    def lookup(self, code):
+        """Mask for a codepoint (int or 1-char str), 0 if unmapped."""
+        if isinstance(code, str):
+            code = ord(code)
+        if code < LATIN1:
+            return self.dense[code]
+        return self.sparse.get(code, 0)
+
+    def mode_tables(self):
+        """ModeTables for CHAR mode with this map, built on first use."""
+        if self._tables is None:
+            self._tables = ModeTables(self.dense)
+        return self._tables
+
+def load_glyph_map(path="glyph_map.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        return GlyphTable(json.load(f))
+
+_compiled_map = (None, None)
+
+def glyph_table(glyph_map):
+    """A GlyphTable for handle_byte()/handle_bytes(), compiling plain dicts.
+
+    The last dict compiled is remembered, so passing the same JSON dict on
+    every call only compiles it once. Edit a GlyphTable, not that dict, if
+    the map changes while bytes are flowing.
+    """
+    global _compiled_map
+    if glyph_map is None or isinstance(glyph_map, GlyphTable):
+        return glyph_map
+    source, table = _compiled_map
+    if source is not glyph_map:
+        table = GlyphTable(glyph_map)
+        _compiled_map = (glyph_map, table)
+    return table
+
+# ─────────────────────────────────────────────
+# OPCODES
+# One entry per byte value. Anything that isn't a control byte is data and
+# gets interpreted by the current mode (SEG: 0..46 light a segment and
+# advance, CHAR: glyph lookup and advance).
+OP_DATA = 0
+OP_START = 1
+OP_CHAR_MODE = 2
+OP_RENDER = 3
+OP_FLUSH = 4
+OP_CLEAR_SLOT = 5
+OP_BAUD = 6
+OP_NEXT_SLOT = 7
+OP_RESET_SLOT = 8
+OP_TOGGLE_MODE = 9
+OP_CLEAR_ALL = 10
+# Block ops carry binary operands, so they sit in the C1 range (0x80..),
+# which is neither a segment id in SEG mode nor a mapped glyph in CHAR mode
+OP_WRITE_SLOT = 11  # 0x80 mask:6         current slot = mask, advance
+OP_FILL = 12        # 0x81 start:2 count:2 mask:6   slots start.. = mask
+OP_COPY = 13        # 0x82 src:2 dst:2 count:2      slots dst.. = slots src..
+OP_SCROLL = 14      # 0x83 dx:1 dy:1                roll the grid, wrapping around
+OP_SHIFT = 15       # 0x84 dx:1 dy:1 mask:6         move the grid, vacated slots = mask
+OP_COLOR = 16       # 0x85 r g b                    current slot's color (0,0,0 = color mode)
+OP_FILL_COLOR = 17  # 0x86 start:2 count:2 r g b    color of slots start..
+OP_BRIGHTNESS = 18  # 0x87 seg:1 level:1            one segment of the current slot, seg 255 = all
+
+OPCODE_TABLE = bytearray(256)
+OPCODE_TABLE[0x01] = OP_START
+OPCODE_TABLE[0x02] = OP_CHAR_MODE
+OPCODE_TABLE[0x03] = OP_RENDER
+OPCODE_TABLE[0x04] = OP_FLUSH
+OPCODE_TABLE[0x08] = OP_CLEAR_SLOT
+OPCODE_TABLE[0x09] = OP_BAUD
+OPCODE_TABLE[0x0A] = OP_NEXT_SLOT
+OPCODE_TABLE[0x0D] = OP_RESET_SLOT
+OPCODE_TABLE[0x1B] = OP_TOGGLE_MODE
+OPCODE_TABLE[0x7F] = OP_CLEAR_ALL
+OPCODE_TABLE[0x80] = OP_WRITE_SLOT
+OPCODE_TABLE[0x81] = OP_FILL
+OPCODE_TABLE[0x82] = OP_COPY
+OPCODE_TABLE[0x83] = OP_SCROLL
+OPCODE_TABLE[0x84] = OP_SHIFT
+OPCODE_TABLE[0x85] = OP_COLOR
+OPCODE_TABLE[0x86] = OP_FILL_COLOR
+OPCODE_TABLE[0x87] = OP_BRIGHTNESS
+OPCODE_TABLE = bytes(OPCODE_TABLE)
+
+OP_NAMES = ["DATA", "START", "CHAR_MODE", "RENDER", "FLUSH", "CLEAR_SLOT", "BAUD",
+            "NEXT_SLOT", "RESET_SLOT", "TOGGLE_MODE", "CLEAR_ALL",
+            "WRITE_SLOT", "FILL", "COPY", "SCROLL", "SHIFT", "COLOR", "FILL_COLOR", "BRIGHTNESS"]
+
+# ─────────────────────────────────────────────
+# BLOCK OPS
+# Operands are little-endian: slot numbers are u16, masks are 6 bytes
+# (48 bits, segments 0..46), scroll steps are signed bytes (+dx = right,
+# +dy = down). After a write/fill/copy the cursor sits just past the slots
+# it wrote, so an encoder can mix them with 0x80 writes in one pass; scrolls
+# leave it alone. Ranges that run off the end of the buffer are clipped.
+# COLOR/FILL_COLOR/BRIGHTNESS set slot attributes and never move the cursor,
+# so they can go right before the segment data of the slot they style.
+MASK_BYTES = 6
+OPERAND_LENGTHS = {OP_WRITE_SLOT: MASK_BYTES, OP_FILL: 4 + MASK_BYTES, OP_COPY: 6,
+                   OP_SCROLL: 2, OP_SHIFT: 2 + MASK_BYTES,
+                   OP_COLOR: 3, OP_FILL_COLOR: 4 + 3, OP_BRIGHTNESS: 2}
+SCROLL_OPS = (OP_SCROLL, OP_SHIFT)
+ATTR_OPS = (OP_COLOR, OP_FILL_COLOR, OP_BRIGHTNESS)
+ALL_SEGMENTS = 255
+SEGMENT_MASK = (1 << LEVEL_COUNT) - 1  # bits 0..46; the 48th operand bit is no segment
+
+def operand_mask(data):
+    """A 6-byte mask operand, clipped to real segments so buffers never hold bit 47."""
+    return int.from_bytes(data, "little") & SEGMENT_MASK
+
+def scroll_operand(op, operand):
+    """(dx, dy, fill) for a SCROLL/SHIFT operand; fill is None when wrapping."""
+    dx = int.from_bytes(operand[0:1], "little", signed=True)
+    dy = int.from_bytes(operand[1:2], "little", signed=True)
+    fill = operand_mask(operand[2:]) if op == OP_SHIFT else None
+    return dx, dy, fill
+
+def run_block_op(op, operand, masks, idx, cols=0, attrs=None):
+    """Apply one block op to a list of masks in place, return the new cursor.
+
+    attrs is the (colors, levels) pair from attr_lists(); attribute ops need
+    it, and COPY/SCROLL/SHIFT move attributes along with the masks when given.
+    """
+    slot_count = len(masks)
+    if op in SCROLL_OPS:
+        dx, dy, fill = scroll_operand(op, operand)
+        masks[:] = scroll_masks(masks, cols, dx, dy, fill)
+        if attrs is not None:
+            scroll_attrs(attrs, cols, dx, dy, fill is None)
+        return idx
+    if op in ATTR_OPS:
+        colors, levels = attrs
+        if op == OP_COLOR:
+            colors[idx] = int.from_bytes(operand, "big")
+        elif op == OP_FILL_COLOR:
+            start = int.from_bytes(operand[0:2], "little")
+            end = min(start + int.from_bytes(operand[2:4], "little"), slot_count)
+            color = int.from_bytes(operand[4:], "big")
+            for slot in range(start, end):
+                colors[slot] = color
+        else:
+            seg, level = operand[0], operand[1]
+            if seg == ALL_SEGMENTS:
+                levels[idx] = bytes([level]) * LEVEL_COUNT
+            elif seg < LEVEL_COUNT:
+                slot_levels = bytearray(levels[idx])
+                slot_levels[seg] = level
+                levels[idx] = bytes(slot_levels)
+        return idx
+    if op == OP_WRITE_SLOT:
+        masks[idx] = operand_mask(operand)
+        return (idx + 1) % slot_count
+    if op == OP_FILL:
+        start = int.from_bytes(operand[0:2], "little")
+        end = min(start + int.from_bytes(operand[2:4], "little"), slot_count)
+        mask = operand_mask(operand[4:])
+        for slot in range(start, end):
+            masks[slot] = mask
+        return end % slot_count if end > start else idx
+    if op == OP_COPY:
+        src = int.from_bytes(operand[0:2], "little")
+        dst = int.from_bytes(operand[2:4], "little")
+        count = int.from_bytes(operand[4:6], "little")
+        count = max(0, min(count, slot_count - src, slot_count - dst))
+        if count:
+            # Slicing copies first, so overlapping ranges behave like memmove
+            masks[dst:dst + count] = masks[src:src + count]
+            for values in attrs or ():
+                values[dst:dst + count] = values[src:src + count]
+            return (dst + count) % slot_count
+        return idx
+    raise ValueError(f"not a block op: {op}")
+
+def op_name(b):
+    return OP_NAMES[OPCODE_TABLE[b]] if 0 <= b < 256 else "DATA"
+
+SEGMENT_BITS = [1 << seg for seg in range(64)]
+
+# 0x03/0x04 are control bytes in every mode, so they mark candidate frame
+# boundaries without decoding. Block op operands can contain them too, so
+# check handle_bytes() actually reported a RENDER there (see is_commit)
+COMMIT_BYTES = re.compile(rb"[\x03\x04]")
+
+# ─────────────────────────────────────────────
+# BULK DECODING
+# Plain data is the bulk of any stream, so handle_bytes() doesn't dispatch
+# it byte by byte:
+#   runs   data bytes and 0x0A, decoded a slice of slots at a time. Every
+#          data byte that writes a slot advances the cursor and so does
+#          0x0A; data bytes that do nothing in this mode are dropped first.
+#   spans  long stretches of runs plus 0x01/0x0D and commit/BAUD bytes,
+#          decoded in one numpy pass (decode_span). Nothing in a span
+#          depends on what an earlier byte left in a slot, and only the
+#          state at the last commit and at the end is ever looked at.
+# Everything else (mode switches, clears, block ops) takes the byte loop.
+BULK_MIN = 1024  # bytes; shorter spans are quicker through the runs
+
+SPAN_STEP, SPAN_WRITE, SPAN_RESET, SPAN_RENDER, SPAN_FLUSH, SPAN_BAUD = range(1, 7)
+SPAN_CONTROLS = {0x0A: SPAN_STEP, 0x01: SPAN_RESET, 0x0D: SPAN_RESET,
+                 0x03: SPAN_RENDER, 0x04: SPAN_FLUSH, 0x09: SPAN_BAUD}
+DATA_BYTES = [b for b in range(256) if OPCODE_TABLE[b] == OP_DATA]
+
+def byte_class(codes):
+    return re.compile(b"[" + b"".join(re.escape(bytes([b])) for b in codes) + b"]+")
+
+SPAN = byte_class(DATA_BYTES + list(SPAN_CONTROLS))
+
+class ModeTables:
+    """Tables for bulk-decoding one mode, values[b] being what data byte b writes (0 = nothing)."""
+
+    def __init__(self, values):
+        self.values = [values[b] if b in DATA_BYTES else 0 for b in range(256)]  # 0x0A writes 0
+        self.array = np.array(self.values, np.uint64)
+        self.runs = byte_class(DATA_BYTES + [0x0A])
+        self.skip = bytes(b for b in DATA_BYTES if not self.values[b])
+        classes = bytearray(256)  # for bytes.translate(): byte -> SPAN_* class, 0 = does nothing
+        for b in DATA_BYTES:
+            classes[b] = SPAN_WRITE if self.values[b] else 0
+        for b, kind in SPAN_CONTROLS.items():
+            classes[b] = kind
+        self.classes = bytes(classes)
+
+# SEG mode ORs the segment's bit in, 47.. light nothing; CHAR mode with no glyph map writes nothing
+SEG_TABLES = ModeTables([SEGMENT_BITS[b] if b < LEVEL_COUNT else 0 for b in range(256)])
+NO_GLYPH_TABLES = ModeTables([0] * 256)
+
+def decode_span(span, masks, idx, tables, char_mode):
+    """Decode a span (bytes SPAN matched) in one go.
+
+    Returns (events, renders, flushes, committed, masks, idx): events as
+    handle_bytes() reports them, committed the masks at the last commit
+    (None without one), masks and idx what the span leaves behind.
+    """
+    count = len(masks)
+    codes = np.frombuffer(span, np.uint8)
+    classes = np.frombuffer(span.translate(tables.classes), np.uint8)
+    stepped = np.flatnonzero((classes == SPAN_STEP) | (classes == SPAN_WRITE))
+    steps = np.flatnonzero(classes[stepped] == SPAN_WRITE)  # steps taken before each write
+    where = stepped[steps]
+    # The cursor is idx + steps so far, then steps since the last 0x01/0x0D
+    restarts = np.searchsorted(stepped, np.flatnonzero(classes == SPAN_RESET))
+    starts = np.concatenate(([-idx], restarts))
+    slots = steps - np.repeat(starts, np.diff(np.concatenate(([0], restarts, [len(stepped)]))))[steps]
+    if len(slots) and slots.max() >= count:
+        slots %= count
+    idx = int(len(stepped) - starts[-1]) % count
+
+    marks = np.flatnonzero(classes >= SPAN_RENDER)
+    kinds = classes[marks].tolist()
+    events = [(pos, "BAUD" if kind == SPAN_BAUD else "RENDER") for pos, kind in zip(marks.tolist(), kinds)]
+    commits = [pos for pos, kind in zip(marks.tolist(), kinds) if kind != SPAN_BAUD]
+
+    state = np.array(masks, np.uint64)
+    writes = tables.array[codes[where]] if char_mode else codes[where]
+    committed = None
+    cut = int(np.searchsorted(where, commits[-1])) if commits else 0
+    if commits:
+        span_writes(state, slots[:cut], writes[:cut], char_mode)
+        committed = state.tolist()
+    span_writes(state, slots[cut:], writes[cut:], char_mode)
+    return events, kinds.count(SPAN_RENDER), kinds.count(SPAN_FLUSH), committed, state.tolist(), idx
+
+def span_writes(state, slots, writes, char_mode):
+    """Apply writes to state (uint64 masks) in order: a glyph per slot in CHAR mode, a segment number in SEG."""
+    count = len(state)
+    if char_mode:
+        # Each slot ends up with the last glyph written to it
+        last = np.full(count, -1)
+        np.maximum.at(last, slots, np.arange(len(slots)))
+        written = last >= 0
+        state[written] = writes[last[written]]
+    else:
+        lit = np.bincount(slots * 64 + writes, minlength=count * 64).reshape(count, 64) > 0
+        state |= np.packbits(lit, axis=1, bitorder="little").view(np.uint64).ravel()
+
+def is_commit(events, piece_length):
+    """True if decoding a piece cut after a commit byte really ended on a RENDER."""
+    return bool(events) and events[-1] == (piece_length - 1, "RENDER")
+
+# ─────────────────────────────────────────────
+# DEVICE
+# Everything one virtual panel needs: the double-buffered glyph buffer, the
+# parser's cursor and mode, and the display-side color state. Devices share
+# nothing, so a process can run as many as it likes, each on its own thread
+# or pickled off to a worker process:
+#
+#     panels = [PeksegDevice(12, 9) for _ in range(16)]
+#     with ThreadPoolExecutor() as pool:
+#         pool.map(PeksegDevice.handle_bytes, panels, streams)
+#
+# Bytes write into glyph_buffer (the back buffer), 0x03/0x04 publish it to
+# front_buffer, and renderers only ever read front_buffer.
+class PeksegDevice:
+    def __init__(self, cols=0, rows=0, glyph_map=None, name=None):
+        self.name = name
+        self.cols = cols
+        self.rows = rows
+        self.glyph_buffer = GlyphBuffer(cols * rows)
+        self.front_buffer = GlyphBuffer(cols * rows)
+        self.glyph_map = glyph_table(glyph_map)
+        self.current_index = 0
+        self.mode = "SEG"
+        self.pending_op = None  # (op, operand so far) when a block op straddles two calls
+        self.frame_count = 0  # 0x03 commits, like the old module global
+        self.commits = 0      # every RENDER result (0x03 and 0x04), the display's frame clock
+        self.segment_color_mode = "static"
+        self.user_selected_color = (255, 255, 255)
+
+    def __repr__(self):
+        return f"PeksegDevice({self.name or len(self.glyph_buffer)}, mode={self.mode}, frame={self.frame_count})"
+
+    def init_buffer(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        self.glyph_buffer.resize(cols * rows)
+        self.front_buffer.resize(cols * rows)
+
+    def commit_frame(self):
+        """Swap the finished back buffer to the front (what 0x03/0x04 do)."""
+        return self.glyph_buffer.commit(self.front_buffer)
+
+    def set_colors(self, segment_color_mode=None, user_selected_color=None):
+        if segment_color_mode is not None:
+            self.segment_color_mode = segment_color_mode
+        if user_selected_color is not None:
+            self.user_selected_color = tuple(user_selected_color)
+
+    def handle_byte(self, b, glyph_map=None):
+        glyph_buffer = self.glyph_buffer
+        glyph_map = glyph_map or self.glyph_map
+        if self.pending_op is not None:
+            op, operand = self.pending_op
+            operand.append(b)
+            if len(operand) == OPERAND_LENGTHS[op]:
+                self.pending_op = None
+                self.run_block_op(op, operand)
+            return None
+        if trace.level >= trace.BYTE:
+            trace.record("PARSER", b, op_name(b), self.current_index, self.mode)
+
+        if b == 0x01:  # START
+            self.current_index = 0
+        elif b == 0x02:  # CHAR MODE
+            self.mode = "CHAR"
+        elif b == 0x03:  # END CHAR
+            self.frame_count += 1
+            self.commits += 1
+            self.commit_frame()
+            return "RENDER"
+        elif b == 0x04:  # FLUSH
+            self.commits += 1
+            self.commit_frame()
+            return "RENDER"
+        elif b == 0x08:  # CLEAR SLOT
+            glyph_buffer.set_mask(self.current_index, 0)
+        elif b == 0x09:  # BAUD RATE
+            return "BAUD"
+        elif b == 0x0A:  # NEXT SLOT
+            self.current_index = (self.current_index + 1) % len(glyph_buffer)
+        elif b == 0x0D:  # RESET SLOT
+            self.current_index = 0
+        elif b == 0x1B:  # TOGGLE MODE
+            self.mode = "SEG" if self.mode == "CHAR" else "CHAR"
+        elif b == 0x7F:  # CLEAR ALL
+            glyph_buffer.clear_all()
+        elif 0x80 <= b <= 0x87:  # block and attribute ops, operands follow
+            self.pending_op = (OPCODE_TABLE[b], bytearray())
+        else:
+            idx = self.current_index
+            if self.mode == "SEG":
+                if 0 <= b <= 46:
+                    glyph_buffer.set_mask(idx, glyph_buffer.masks[idx] | (1 << b))
+                    self.current_index = (idx + 1) % len(glyph_buffer)
+            elif self.mode == "CHAR" and glyph_map:
+                glyph = glyph_table(glyph_map).lookup(b)
+                if glyph:
+                    glyph_buffer.set_mask(idx, glyph)
+                    self.current_index = (idx + 1) % len(glyph_buffer)
+
+        return None
+
+    def run_block_op(self, op, operand):
+        if op in SCROLL_OPS:
+            self.scroll(*scroll_operand(op, operand))
+            return
+        glyph_buffer = self.glyph_buffer
+        masks = glyph_buffer.masks.tolist()
+        attrs = None
+        if op in ATTR_OPS or (op == OP_COPY and glyph_buffer.has_attrs):
+            attrs = glyph_buffer.attr_lists()
+        self.current_index = run_block_op(op, operand, masks, self.current_index, self.cols, attrs)
+        self.store_masks(masks)
+        if attrs is not None:
+            glyph_buffer.store_attrs(*attrs)
+
+    def scroll(self, dx=0, dy=0, fill=None):
+        """Scroll the back buffer by whole slots; wraps unless a fill mask is given.
+
+        Same as sending 0x83 (wrap) or 0x84 (fill); shows up at the next commit.
+        """
+        self.glyph_buffer.scroll(self.cols, dx, dy, fill)
+
+    def handle_bytes(self, data, glyph_map=None):
+        """Decode a whole buffer (bytes, bytearray or memoryview) in one call.
+
+        Gives the same buffer state as calling handle_byte() on every byte.
+        Returns a list of (offset, result) for every byte where handle_byte()
+        would have returned something, i.e. "RENDER" for 0x03/0x04 and "BAUD"
+        for 0x09.
+
+        With byte-level tracing on, this falls back to handle_byte() so every
+        byte still lands in the trace ring.
+        """
+        glyph_map = glyph_map or self.glyph_map
+        events = []
+        if trace.level >= trace.BYTE:
+            for pos, b in enumerate(bytes(data)):
+                result = self.handle_byte(b, glyph_map)
+                if result:
+                    events.append((pos, result))
+            return events
+
+        table = OPCODE_TABLE
+        bits = SEGMENT_BITS
+        # Work on a plain list (array item writes box every int) and store it back at the end
+        masks = self.glyph_buffer.masks.tolist()
+        slot_count = len(masks)
+        idx = self.current_index
+        char_mode = self.mode == "CHAR"
+        chars = glyph_table(glyph_map) if glyph_map else None
+        glyphs = chars.dense if chars else None
+        renders = flushes = 0
+        committed = None
+        # Slot attributes are only unpacked once an op needs them
+        back = self.glyph_buffer
+        moves_attrs = (OP_COPY,) + SCROLL_OPS if back.has_attrs else ()
+        attrs = committed_attrs = None
+        scrolls = []
+        committed_scrolls = 0
+        cols = self.cols
+        data = bytes(data)
+        pos, end = 0, len(data)
+
+        # Finish a block op whose operand was cut off at the end of the last call
+        if self.pending_op is not None:
+            op, operand = self.pending_op
+            need = OPERAND_LENGTHS[op] - len(operand)
+            operand += data[:need]
+            pos = min(need, end)
+            if len(operand) < OPERAND_LENGTHS[op]:
+                return events
+            self.pending_op = None
+            if op in ATTR_OPS or op in moves_attrs:
+                attrs = back.attr_lists()
+            idx = run_block_op(op, operand, masks, idx, cols, attrs)
+            if op in SCROLL_OPS:
+                scrolls.append(scroll_operand(op, operand))
+
+        seg_tables = SEG_TABLES if slot_count else None
+        char_tables = (chars.mode_tables() if chars else NO_GLYPH_TABLES) if slot_count else None
+        tables = char_tables if char_mode else seg_tables
+        span_end = 0
+        while pos < end:
+            if tables is not None:
+                if pos >= span_end:
+                    span = SPAN.match(data, pos)
+                    span_end = pos + 1 if span is None else span.end()
+                    if span is not None and span_end - pos >= BULK_MIN:
+                        span_events, span_renders, span_flushes, last, masks, idx = decode_span(
+                            data[pos:span_end], masks, idx, tables, char_mode)
+                        events += [(pos + offset, result) for offset, result in span_events]
+                        renders += span_renders
+                        flushes += span_flushes
+                        if last is not None:
+                            committed = last
+                            committed_scrolls = len(scrolls)
+                            if attrs is not None:
+                                committed_attrs = (attrs[0][:], attrs[1][:])
+                        pos = span_end
+                        continue
+                match = tables.runs.match(data, pos)
+                if match is not None:
+                    # Decode the whole run at once, one slice of slots per wrap of the cursor
+                    values = data[pos:match.end()].translate(None, tables.skip)
+                    pos = match.end()
+                    run_masks = tables.values
+                    start = 0
+                    while start < len(values):
+                        take = min(len(values) - start, slot_count - idx)
+                        new = map(run_masks.__getitem__, values[start:start + take])
+                        if char_mode:
+                            masks[idx:idx + take] = [glyph or old for old, glyph in zip(masks[idx:idx + take], new)]
+                        else:
+                            masks[idx:idx + take] = map(or_, masks[idx:idx + take], new)
+                        idx = (idx + take) % slot_count
+                        start += take
+                    if pos == end:
+                        break
+            b = data[pos]
+            pos += 1
+            op = table[b]
+            if op == OP_DATA:
+                if char_mode:
+                    if glyphs:
+                        glyph = glyphs[b]
+                        if glyph:
+                            masks[idx] = glyph
+                            idx = (idx + 1) % slot_count
+                elif b <= 46:
+                    masks[idx] |= bits[b]
+                    idx = (idx + 1) % slot_count
+            elif op == OP_NEXT_SLOT:
+                idx = (idx + 1) % slot_count
+            elif op == OP_RENDER:
+                renders += 1
+                events.append((pos - 1, "RENDER"))
+                committed = masks[:]
+                committed_scrolls = len(scrolls)
+                if attrs is not None:
+                    committed_attrs = (attrs[0][:], attrs[1][:])
+            elif op == OP_FLUSH:
+                flushes += 1
+                events.append((pos - 1, "RENDER"))
+                committed = masks[:]
+                committed_scrolls = len(scrolls)
+                if attrs is not None:
+                    committed_attrs = (attrs[0][:], attrs[1][:])
+            elif op == OP_CLEAR_SLOT:
+                masks[idx] = 0
+            elif op == OP_START or op == OP_RESET_SLOT:
+                idx = 0
+            elif op == OP_BAUD:
+                events.append((pos - 1, "BAUD"))
+            elif op == OP_CHAR_MODE:
+                char_mode = True
+                tables = char_tables
+            elif op == OP_TOGGLE_MODE:
+                char_mode = not char_mode
+                tables = char_tables if char_mode else seg_tables
+            elif op == OP_CLEAR_ALL:
+                masks = [0] * slot_count
+            else:  # block op: the operand is the next few bytes
+                need = OPERAND_LENGTHS[op]
+                operand = data[pos:pos + need]
+                if len(operand) < need:
+                    self.pending_op = (op, bytearray(operand))
+                    break
+                pos += need
+                if attrs is None and (op in ATTR_OPS or op in moves_attrs):
+                    attrs = back.attr_lists()
+                idx = run_block_op(op, operand, masks, idx, cols, attrs)
+                if op in SCROLL_OPS:
+                    scrolls.append(scroll_operand(op, operand))
+
+        # Only the last commit in the chunk is ever visible, so publish that state,
+        # then leave whatever came after it in the back buffer
+        if committed is not None:
+            self.store_masks(committed)
+            if committed_attrs is not None:
+                back.store_attrs(*committed_attrs)
+            back.scrolls += scrolls[:committed_scrolls]
+            self.commit_frame()
+        self.store_masks(masks)
+        if attrs is not None:
+            back.store_attrs(*attrs)
+        back.scrolls += scrolls[committed_scrolls:]
+        self.frame_count += renders
+        self.commits += renders + flushes
+        self.current_index = idx
+        self.mode = "CHAR" if char_mode else "SEG"
+        return events
+
+    def store_masks(self, masks):
+        glyph_buffer = self.glyph_buffer
+        # Compared as lists, so an unchanged buffer (the usual case right after a commit) costs one C compare
+        old = glyph_buffer.masks.tolist()
+        if old != masks:
+            glyph_buffer.dirty.update([slot for slot, (a, b) in enumerate(zip(old, masks)) if a != b])
+            glyph_buffer.masks[:] = array("Q", masks)
+
+# ─────────────────────────────────────────────
+# MODULE-LEVEL PARSER
+# The original single-display API, kept working on top of one default
+# device. glyph_buffer / front_buffer are that device's buffer objects, and
+# current_index, mode and frame_count read through to it.
+default_device = PeksegDevice()
+glyph_buffer = default_device.glyph_buffer
+front_buffer = default_device.front_buffer
+
+def __getattr__(name):
+    if name in ("current_index", "mode", "frame_count"):
+        return getattr(default_device, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def init_buffer(cols, rows):
-    global glyph_buffer
-    glyph_buffer = [set() for _ in range(cols * rows)]
+    default_device.init_buffer(cols, rows)
+
+def commit_frame():
+    return default_device.commit_frame()
 
 def handle_byte(b, glyph_map=None):
-    global current_index, mode, frame_count
-    print(f"[PARSER] Handling byte: {b}")
-    ...
-    
-
-    if b == 0x01:  # START
-        current_index = 0
-    elif b == 0x02:  # CHAR MODE
-        mode = "CHAR"
-    elif b == 0x03:  # END CHAR
-        frame_count += 1
-        return "RENDER"
-    elif b == 0x04:  # FLUSH
-        return "RENDER"
-    elif b == 0x08:  # CLEAR SLOT
-        glyph_buffer[current_index].clear()
-    elif b == 0x09:  # BAUD RATE
-        return "BAUD"
-    elif b == 0x0A:  # NEXT SLOT
-        current_index = (current_index + 1) % len(glyph_buffer)
-    elif b == 0x0D:  # RESET SLOT
-        current_index = 0
-    elif b == 0x1B:  # TOGGLE MODE
-        mode = "SEG" if mode == "CHAR" else "CHAR"
-    elif b == 0x7F:  # CLEAR ALL
-        for slot in glyph_buffer:
-            slot.clear()
-    else:
-        if mode == "SEG":
-            if 0 <= b <= 46:
-                glyph_buffer[current_index].add(b)
-                print(f"[PARSER] Added segment {b} to slot {current_index}")
-                current_index = (current_index + 1) % len(glyph_buffer)
-        elif mode == "CHAR" and glyph_map:
-            char = chr(b)
-            segments = glyph_map.get(char)
-            if segments:
-                glyph_buffer[current_index] = set(segments)
-                print(f"[PARSER] Mapped '{char}' to segments {segments} in slot {current_index}")
-                current_index = (current_index + 1) % len(glyph_buffer)
-
-
-    return None
+    return default_device.handle_byte(b, glyph_map)
+
+def handle_bytes(data, glyph_map=None):
+    return default_device.handle_bytes(data, glyph_map)
+
+def scroll(dx=0, dy=0, fill=None):
+    default_device.scroll(dx, dy, fill)
@@ -0,0 +1,63 @@
+# pekseg_persistence.py
+import time
+
+import numpy as np
+
+# ─────────────────────────────────────────────
+# PHOSPHOR PERSISTENCE
+# Segments light up at full intensity straight away but fade out when they
+# go dark: every segment of every slot has an intensity in 0..1 that decays
+# exponentially (halving every `half_life` seconds) once its bit is cleared,
+# and snaps to zero below `cutoff`. Only slots with something still fading
+# (plus the ones whose masks just changed) are touched each tick, in one
+# array operation, and only those get redrawn. Once everything has faded
+# `active` goes False and idle ticks cost nothing again.
+SEGMENT_COUNT = 47
+HALF_LIFE = 0.12
+CUTOFF = 1 / 64
+
+class Persistence:
+    def __init__(self, slots, half_life=HALF_LIFE, cutoff=CUTOFF, clock=time.monotonic):
+        self.half_life = half_life
+        self.cutoff = cutoff
+        self.clock = clock
+        self.intensity = np.zeros((slots, SEGMENT_COUNT), dtype=np.float32)
+        self.lit = np.zeros((slots, SEGMENT_COUNT), dtype=bool)
+        self.fading = np.zeros(slots, dtype=bool)
+        self.bits = np.array([1 << seg for seg in range(SEGMENT_COUNT)], dtype=np.uint64)
+        self.last_tick = None
+
+    @property
+    def active(self):
+        """True while some slot still has a segment fading out."""
+        return bool(self.fading.any())
+
+    def update(self, masks, changed):
+        """Advance one tick and return the slots whose picture changed.
+
+        changed is the slots whose masks changed since the last call (the
+        canvas' pending set). Of the slots returned, the ones with `fading`
+        set need drawing with `intensity`, the rest are back to plain tiles.
+        """
+        now = self.clock()
+        dt = 0 if self.last_tick is None else now - self.last_tick
+        self.last_tick = now
+        changed = np.fromiter(changed, dtype=np.intp)
+        if len(changed):
+            changed_masks = np.array([masks[idx] for idx in changed], dtype=np.uint64)
+            self.lit[changed] = (changed_masks[:, None] & self.bits) != 0
+        rows = np.union1d(np.flatnonzero(self.fading), changed)
+        if not len(rows):
+            return []
+        # Only rows that were already fading have been decaying since the last
+        # tick. Ticks stop while nothing fades, so dt can be huge; a slot going
+        # dark just now starts from the intensity it had, not from dt ago.
+        decay = np.where(self.fading[rows], np.float32(0.5 ** (dt / self.half_life)), np.float32(1))
+        glow = self.intensity[rows] * decay[:, None]
+        glow[glow < self.cutoff] = 0
+        lit = self.lit[rows]
+        glow[lit] = 1
+        self.intensity[rows] = glow
+        # Anything left burning on a segment that's off
+        self.fading[rows] = (glow > lit).any(axis=1)
+        return rows.tolist()
@@ -0,0 +1,425 @@
+# pekseg_render.py
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, ImageOps
+from pekseg_colors import apply_slot_attributes, color_array, get_mode
+from pekseg_parser import COMMIT_BYTES, LEVEL_COUNT, GlyphBuffer, is_commit, segments_of
+from pekseg_sprites import Sprite, load_segment_sprites
+
+# ─────────────────────────────────────────────
+# COLOR STATE
+# Colors come from pekseg_colors: one (slots, 47, 3) array per frame from the
+# registered mode. A mode's colors only depend on frame_count modulo its
+# period, so tiles repeat: rainbow cycles every 72 frames, trans every 3.
+FOREGROUND_SEGMENTS = range(39)
+PREBUILD_FRAMES = 8  # modes with a period up to this get their atlas built up front
+
+def mode_colors(segment_color_mode, user_selected_color):
+    """Every RGB a foreground segment can take in this mode, over one period."""
+    mode = get_mode(segment_color_mode)
+    frames = [mode.array(1, user_selected_color, frame)[0, :39] for frame in range(mode.period or 1)]
+    return [tuple(rgb) for rgb in np.unique(np.concatenate(frames), axis=0).tolist()]
+
+def segment_color(i, segment_color_mode, user_selected_color, frame_count):
+    return tuple(color_array(segment_color_mode, 1, user_selected_color, frame_count)[0, i].tolist())
+
+def color_key(segment_color_mode, user_selected_color, frame_count):
+    """Everything about the current colors that can change how a tile looks."""
+    return get_mode(segment_color_mode).key(user_selected_color, frame_count)
+
+# ─────────────────────────────────────────────
+# TILE CACHE
+# Finished slot tiles keyed by (segment mask, color key). A hit skips the
+# Image.new + alpha_composite + colorize work entirely. Tiles handed out are
+# shared, so callers must not draw on them.
+class TileCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.tiles = OrderedDict()
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def get(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            self.misses += 1
+            return None
+        self.tiles.move_to_end(key)
+        self.hits += 1
+        return tile
+
+    def put(self, key, tile):
+        size = tile.width * tile.height * len(tile.getbands())
+        if size > self.max_bytes:
+            return tile
+        old = self.tiles.pop(key, None)
+        if old is not None:
+            self.bytes_used -= old.width * old.height * len(old.getbands())
+        self.tiles[key] = tile
+        self.bytes_used += size
+        while self.bytes_used > self.max_bytes:
+            _, evicted = self.tiles.popitem(last=False)
+            self.bytes_used -= evicted.width * evicted.height * len(evicted.getbands())
+        return tile
+
+    def get_or_build(self, key, build):
+        tile = self.get(key)
+        if tile is None:
+            tile = self.put(key, build())
+        return tile
+
+    def clear(self):
+        self.tiles.clear()
+        self.bytes_used = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "tiles": len(self.tiles),
+            "bytes": self.bytes_used,
+            "max_bytes": self.max_bytes,
+        }
+
+# ─────────────────────────────────────────────
+# SEGMENT ATLAS
+def colorize_segment(img, rgb):
+    # Ensure RGB is in 0–255 range
+    if isinstance(rgb, tuple) and all(isinstance(c, float) for c in rgb):
+        rgb = tuple(int(c * 255) for c in rgb)
+
+    gray = ImageOps.grayscale(img)
+    colored = ImageOps.colorize(gray, black="black", white=rgb).convert("RGBA")
+    # colorize() returns plain RGB; put the segment's own alpha back so only
+    # the segment covers the tile, not a full opaque rectangle
+    colored.putalpha(img.getchannel("A"))
+    return colored
+
+class SegmentAtlas:
+    """Colorized segment sprites, built once per (segment, RGB).
+
+    Entries are just the sprite's bounding box; composite them at the
+    sprite's offset.
+
+    sync() drops everything when the color mode or the static color changes,
+    then prebuilds the new mode's set if it's small: one image per segment for
+    static, one per palette entry for trans. Rainbow has 72 hue steps per
+    segment and per-slot modes could have anything, so those fill in lazily
+    as they come up and stay under the same byte cap.
+    """
+
+    def __init__(self, sprites, max_bytes=64 * 1024 * 1024):
+        self.sprites = sprites
+        self.cache = TileCache(max_bytes)
+        self.color_state = None
+
+    def sync(self, segment_color_mode, user_selected_color):
+        mode = get_mode(segment_color_mode)
+        if mode.animated:
+            state = (mode.name,)
+        else:
+            state = (mode.name, tuple(user_selected_color))
+        if state == self.color_state:
+            return
+        self.color_state = state
+        self.cache.clear()
+        if not mode.per_slot and (mode.period or 1) <= PREBUILD_FRAMES:
+            for rgb in mode_colors(segment_color_mode, user_selected_color):
+                for seg in FOREGROUND_SEGMENTS:
+                    if seg in self.sprites:
+                        self.get(seg, rgb)
+
+    def get(self, seg, rgb):
+        key = (seg, tuple(rgb))
+        return self.cache.get_or_build(key, lambda: colorize_segment(self.sprites[seg].image, rgb))
+
+# ─────────────────────────────────────────────
+# HEADLESS RENDERER
+# Everything render_display does short of Tk: segment loading, color modes,
+# atlas, tile cache and the optional NumPy batch path. The Tk displays draw
+# their tiles through this, and batch jobs / tests can use it directly.
+SEGMENT_COUNT = 47
+GHOST_SEGMENTS = range(39, 47)
+GHOST_BITS = (1 << len(GHOST_SEGMENTS)) - 1
+
+def load_segment_images(folder="segments", glyph_width=80, glyph_height=99, count=SEGMENT_COUNT):
+    """Full-canvas segment images; the Renderer itself works on sprites."""
+    sprites = load_segment_sprites(folder, glyph_width, glyph_height, count)
+    return {i: sprite.expand() for i, sprite in sprites.items()}
+
+def buffer_from(source):
+    """The GlyphBuffer behind a parser (its committed front_buffer) or buffer, else None."""
+    if hasattr(source, "front_buffer"):
+        source = source.front_buffer
+    elif hasattr(source, "glyph_buffer"):
+        source = source.glyph_buffer
+    return source if isinstance(source, GlyphBuffer) else None
+
+def masks_from(source):
+    """Slot masks from a GlyphBuffer, a parser (its committed front_buffer), or a list of masks."""
+    buffer = buffer_from(source)
+    if buffer is not None:
+        return list(buffer.masks)
+    return [int(mask) for mask in source]
+
+class Renderer:
+    def __init__(self, cols=12, rows=9, glyph_width=80, glyph_height=99, segment_images=None,
+                 segment_folder="segments", compositor="pil", tile_cache_bytes=32 * 1024 * 1024,
+                 lit_overlay=None):
+        self.cols = cols
+        self.rows = rows
+        self.glyph_width = glyph_width
+        self.glyph_height = glyph_height
+        # segment_images may be full-canvas images or pekseg_sprites.Sprites
+        if segment_images is None:
+            segment_images = load_segment_sprites(segment_folder, glyph_width, glyph_height)
+        self.sprites = {i: img if isinstance(img, Sprite) else Sprite.from_image(img)
+                        for i, img in segment_images.items()}
+        self.atlas = SegmentAtlas(self.sprites)
+        self.tile_cache = TileCache(tile_cache_bytes)
+        # RGBA tint laid under every slot that has any segment lit (debug aid)
+        self.lit_overlay = lit_overlay
+        self.compositor = None
+        if compositor == "numpy":
+            from pekseg_compositor import FrameCompositor
+            self.compositor = FrameCompositor(self.sprites, glyph_width, glyph_height)
+        self.glow_compositor = None  # see glow_tiles()
+        # (ghost bits, lit) -> prebuilt slot background, see ghost_layer()
+        self.ghost_layers = {}
+        self.faded_segments = {}
+
+        self.segment_color_mode = "static"
+        self.color_mode = get_mode("static")
+        self.user_selected_color = (255, 255, 255)
+        self.frame_count = 0
+
+    def set_colors(self, segment_color_mode, user_selected_color, frame_count):
+        self.segment_color_mode = segment_color_mode
+        self.color_mode = get_mode(segment_color_mode)
+        self.user_selected_color = tuple(user_selected_color)
+        self.frame_count = frame_count
+
+    @property
+    def animated(self):
+        """True when lit slots need a redraw every frame.
+
+        Colors either move with frame_count or differ per slot, so a tile
+        scrolled to another slot would carry the wrong ones.
+        """
+        return self.color_mode.animated or self.color_mode.per_slot
+
+    def color_key(self):
+        return self.color_mode.key(self.user_selected_color, self.frame_count)
+
+    def colors(self, slots=1):
+        """This frame's (slots, 47, 3) color array."""
+        return self.color_mode.array(slots, self.user_selected_color, self.frame_count)
+
+    def segment_color(self, i):
+        return tuple(self.colors()[0, i].tolist())
+
+    def build_tile(self, mask, colors=None):
+        """PIL path: composite one slot from scratch. colors is the slot's (47, 3) row."""
+        segments = segments_of(mask)
+        rgbs = (self.colors()[0] if colors is None else colors).tolist()
+        # Overlay + background segments (39–46) come prebuilt; draw on a copy
+        base = self.ghost_layer(mask >> GHOST_SEGMENTS[0], bool(mask and self.lit_overlay)).copy()
+
+        # Foreground segments (0–38) with the current color mode, each into its own box
+        for i in segments:
+            if i < 39 and i in self.sprites:
+                self.sprites[i].composite(base, self.atlas.get(i, tuple(rgbs[i])))
+
+        return base
+
+    def ghost_layer(self, ghosts, lit=False):
+        """Starting canvas for a slot: black, the lit overlay if lit, then the
+        faded background segments whose bits are set in `ghosts` (mask >> 39).
+
+        Built once per combination and shared, so callers draw on a copy. Each
+        one is the combination without its highest ghost plus that ghost, one
+        composite per new combination instead of up to 8 per tile.
+        """
+        ghosts &= GHOST_BITS  # a stray bit above segment 46 has no ghost to draw
+        key = (ghosts, lit)
+        layer = self.ghost_layers.get(key)
+        if layer is not None:
+            return layer
+        if not ghosts:
+            layer = Image.new("RGBA", (self.glyph_width, self.glyph_height), (0, 0, 0, 255))
+            if lit:
+                layer.alpha_composite(Image.new("RGBA", layer.size, self.lit_overlay))
+        else:
+            top = ghosts.bit_length() - 1
+            layer = self.ghost_layer(ghosts & ~(1 << top), lit)
+            seg = GHOST_SEGMENTS[top]
+            if seg in self.sprites:
+                if seg not in self.faded_segments:
+                    # Full canvas on purpose: the faded copy washes the whole tile
+                    faded = self.sprites[seg].expand()
+                    faded.putalpha(30)
+                    self.faded_segments[seg] = faded
+                layer = layer.copy()
+                layer.alpha_composite(self.faded_segments[seg])
+        self.ghost_layers[key] = layer
+        return layer
+
+    def backdrop(self, masks):
+        """Per-slot starting color for the NumPy compositor: the lit overlay
+        washed over black for non-empty masks, like ghost_layer() draws it."""
+        if not self.lit_overlay:
+            return None
+        from pekseg_compositor import over
+        *rgb, a = self.lit_overlay
+        wash = over(0, np.array(rgb), a)
+        return [wash if mask else (0, 0, 0) for mask in masks]
+
+    def build_tiles(self, masks, colors):
+        """Tiles for `masks`; colors is (47, 3) for all of them or one (47, 3) row each."""
+        if self.compositor is not None:
+            backdrop = self.backdrop(masks)
+            return [Image.fromarray(pixels, "RGBA") for pixels in self.compositor.compose_slots(masks, colors, backdrop)]
+        if colors.ndim == 2:
+            return [self.build_tile(mask, colors) for mask in masks]
+        return [self.build_tile(mask, row) for mask, row in zip(masks, colors)]
+
+    def tiles(self, masks):
+        """{mask: tile} for every distinct mask, cache misses built in one batch.
+
+        Ignores per-slot colors (every tile gets slot 0's); use slot_tiles()
+        to draw a grid.
+        """
+        self.atlas.sync(self.segment_color_mode, self.user_selected_color)
+        ckey = self.color_key()
+        tiles = {}
+        for mask in masks:
+            if mask not in tiles:
+                tiles[mask] = self.tile_cache.get((mask, ckey))
+
+        missing = [mask for mask, tile in tiles.items() if tile is None]
+        if missing:
+            for mask, tile in zip(missing, self.build_tiles(missing, self.colors()[0])):
+                tiles[mask] = self.tile_cache.put((mask, ckey), tile)
+        return tiles
+
+    def tile(self, mask):
+        return self.tiles([mask])[mask]
+
+    def slot_tiles(self, source, slots):
+        """{slot: tile} for the given slots of a whole grid.
+
+        source is a GlyphBuffer (so per-slot color and brightness apply) or
+        a list of masks. Slots with nothing of their own share one tile per
+        mask; per-slot modes and slot attributes get tiles keyed by the slot
+        or its attributes, built with their own rows of the frame's colors.
+        """
+        attrs = source if isinstance(source, GlyphBuffer) and source.has_attrs else None
+        masks = source.masks if isinstance(source, GlyphBuffer) else source
+        per_slot = self.color_mode.per_slot
+        if not per_slot and attrs is None:
+            tiles = self.tiles([masks[idx] for idx in slots])
+            return {idx: tiles[masks[idx]] for idx in slots}
+
+        self.atlas.sync(self.segment_color_mode, self.user_selected_color)
+        ckey = self.color_key()
+        keys = {}
+        for idx in slots:
+            attr_key = attrs.attr_key(idx) if attrs is not None else None
+            if per_slot or attr_key is not None:
+                keys[idx] = (masks[idx], ckey, idx if per_slot else None, attr_key)
+            else:
+                keys[idx] = (masks[idx], ckey)
+        tiles = {}
+        builds = {}  # key -> a slot to build it from
+        for idx, key in keys.items():
+            if key not in tiles:
+                tiles[key] = self.tile_cache.get(key)
+                if tiles[key] is None:
+                    builds[key] = idx
+        if builds:
+            missing = list(builds.values())
+            colors = self.slot_colors(source, missing)
+            for key, tile in zip(builds, self.build_tiles([masks[idx] for idx in missing], colors)):
+                tiles[key] = self.tile_cache.put(key, tile)
+        return {idx: tiles[key] for idx, key in keys.items()}
+
+    def slot_colors(self, source, slots):
+        """(len(slots), 47, 3) colors for those slots: the mode's, then their own attributes."""
+        colors = self.colors(len(source))[slots]
+        if isinstance(source, GlyphBuffer) and source.has_attrs:
+            rgb = np.frombuffer(source.rgb, dtype=np.uint8).reshape(-1, 3)[slots]
+            levels = np.frombuffer(source.levels, dtype=np.uint8).reshape(-1, LEVEL_COUNT)[slots]
+            colors = apply_slot_attributes(colors, rgb, levels)
+        return colors
+
+    def glow_tiles(self, source, slots, intensity):
+        """{slot: tile} drawn with fractional segment intensity, never cached.
+
+        intensity is a (slots, 47) array for the whole grid, e.g.
+        Persistence.intensity. Always goes through the NumPy compositor,
+        made on first use if this renderer draws with PIL.
+        """
+        slots = list(slots)
+        if not slots:
+            return {}
+        if self.glow_compositor is None:
+            from pekseg_compositor import FrameCompositor
+            self.glow_compositor = self.compositor or FrameCompositor(
+                self.sprites, self.glyph_width, self.glyph_height)
+        masks = source.masks if isinstance(source, GlyphBuffer) else source
+        slot_masks = [masks[idx] for idx in slots]
+        pixels = self.glow_compositor.compose_slots(slot_masks, self.slot_colors(source, slots),
+                                                    self.backdrop(slot_masks), intensity[slots])
+        return {idx: Image.fromarray(tile, "RGBA") for idx, tile in zip(slots, pixels)}
+
+    def render(self, source):
+        """Whole grid as one RGBA image."""
+        masks = masks_from(source)[:self.cols * self.rows]
+        buffer = buffer_from(source)
+        tiles = self.slot_tiles(buffer if buffer is not None and len(buffer) == len(masks) else masks,
+                                range(len(masks)))
+        frame = Image.new("RGBA", (self.cols * self.glyph_width, self.rows * self.glyph_height), (0, 0, 0, 255))
+        for idx in range(len(masks)):
+            x = (idx % self.cols) * self.glyph_width
+            y = (idx // self.cols) * self.glyph_height
+            frame.paste(tiles[idx], (x, y))
+        return frame
+
+    def render_device(self, device):
+        """A PeksegDevice's committed frame, in that device's own color mode."""
+        self.set_colors(device.segment_color_mode, device.user_selected_color, device.commits)
+        return self.render(device.front_buffer)
+
+    def render_array(self, source):
+        """Whole grid as a (rows * H, cols * W, 4) uint8 NumPy array."""
+        return np.asarray(self.render(source))
+
+    def render_stream(self, data, parser, glyph_map=None):
+        """Feed bytes through a parser and yield one frame per 0x03/0x04 commit.
+
+        parser is anything with handle_bytes() and a front_buffer, e.g. the
+        pekseg_parser module itself. The stream is split on commit bytes and
+        each piece decoded in bulk; pieces that didn't end on a real RENDER
+        (the byte was block op operand data) don't produce a frame.
+        frame_count follows the commits, so animated color modes advance the
+        same way they do on screen.
+        """
+        view = memoryview(data)
+        start = 0
+        for match in COMMIT_BYTES.finditer(view):
+            end = match.end()
+            events = parser.handle_bytes(view[start:end], glyph_map)
+            committed = is_commit(events, end - start)
+            start = end
+            if not committed:
+                continue  # commit byte inside a block op operand
+            self.frame_count += 1
+            yield self.render(parser)
+        if start < len(view):
+            parser.handle_bytes(view[start:], glyph_map)
@@ -0,0 +1,148 @@
+# pekseg_scheduler.py
+import time
+from collections import deque
+
+# ─────────────────────────────────────────────
+# FRAME SCHEDULER
+# Replaces time.sleep(BAUD_DELAY) on the Tk thread and the "re-render every
+# 16 ms" tick loop:
+#   - bytes are decoded as soon as they're fed, up to the next BAUD (0x09)
+#   - a BAUD holds the *rest of the input* until one interval later, via
+#     after(), so pacing still spaces the stream out but never blocks the UI
+#   - RENDER commits only mark a frame as pending; frames go out on a fixed
+#     clock, at most one per interval, and ticks with nothing new are skipped
+#   - commits that land between two ticks collapse into the newest one: the
+#     ones never shown are counted as `dropped`, and `latency` is how long the
+#     oldest of them waited, so a 500 commit/s producer costs 60 renders/s
+#     and a frame is never more than about one interval stale
+# `after` is anything shaped like Tk's root.after(ms, callback).
+class FrameScheduler:
+    def __init__(self, after, decode, present, interval=1 / 60, idle_check=None,
+                 clock=time.monotonic, pace_byte=0x09):
+        self.after = after
+        self.decode = decode
+        self.present = present
+        self.interval = interval
+        # Optional callable: True when a tick should present even without a commit
+        self.idle_check = idle_check
+        self.clock = clock
+        self.pace_byte = pace_byte
+
+        self.pending_input = deque()
+        self.resume_at = None
+        self.frame_pending = False
+        self.next_tick = None
+        self.running = False
+
+        self.committed = 0
+        self.presented = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.unpresented = 0      # commits since the last present
+        self.oldest_commit = None  # clock() of the first of those
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    # ── input side ──
+    def feed(self, data):
+        if data:
+            self.pending_input.append(bytes(data))
+        if self.resume_at is None:
+            self._drain()
+
+    def discard_input(self):
+        """Drop input that's fed but not decoded yet (held back behind a BAUD)."""
+        self.pending_input.clear()
+
+    def _drain(self):
+        while self.pending_input:
+            chunk = self.pending_input[0]
+            cut = chunk.find(self.pace_byte)
+            if cut < 0:
+                self.pending_input.popleft()
+                self._decode(chunk)
+                continue
+
+            # Decode through the BAUD byte, park the rest until the deadline
+            head, rest = chunk[:cut + 1], chunk[cut + 1:]
+            if rest:
+                self.pending_input[0] = rest
+            else:
+                self.pending_input.popleft()
+            events = self._decode(head)
+            if not events or events[-1] != (cut, "BAUD"):
+                continue  # 0x09 inside a block op operand, not a real BAUD
+            self.resume_at = self.clock() + self.interval
+            self.after(max(1, round(self.interval * 1000)), self._resume)
+            return
+
+    def _resume(self):
+        self.resume_at = None
+        self._drain()
+
+    def _decode(self, chunk):
+        events = self.decode(chunk)
+        commits = sum(1 for _, result in events if result == "RENDER")
+        if commits:
+            self.request_frame(commits)
+        return events
+
+    # ── output side ──
+    def request_frame(self, commits=0):
+        """Present on the next tick; `commits` counts frames committed elsewhere (e.g. ingest)."""
+        self.frame_pending = True
+        if commits:
+            self.committed += commits
+            self.unpresented += commits
+            if self.oldest_commit is None:
+                self.oldest_commit = self.clock()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.next_tick = self.clock()
+        self._tick()
+
+    def stop(self):
+        self.running = False
+
+    def _tick(self):
+        if not self.running:
+            return
+        try:
+            if self.frame_pending or (self.idle_check is not None and self.idle_check()):
+                self.frame_pending = False
+                self.present()
+                self.presented += 1
+                if self.unpresented:
+                    self.dropped += self.unpresented - 1
+                    self.latency = self.clock() - self.oldest_commit
+                    self.max_latency = max(self.max_latency, self.latency)
+                    self.unpresented = 0
+                    self.oldest_commit = None
+            else:
+                self.skipped += 1
+        finally:
+            # One frame that fails to render must not stop all the ones after it
+            self._schedule()
+
+    def _schedule(self):
+        # Fixed cadence: aim for the next slot on the clock, not "now + interval",
+        # and drop whole ticks we've already missed instead of bunching them up
+        now = self.clock()
+        self.next_tick += self.interval
+        if self.next_tick < now:
+            self.next_tick += ((now - self.next_tick) // self.interval + 1) * self.interval
+        self.after(max(0, round((self.next_tick - now) * 1000)), self._tick)
+
+    def stats(self):
+        return {
+            "committed": self.committed,
+            "presented": self.presented,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "latency": self.latency,
+            "max_latency": self.max_latency,
+            "queued_bytes": sum(len(chunk) for chunk in self.pending_input),
+        }
@@ -0,0 +1,122 @@
+# pekseg_sprites.py
+import argparse
+import os
+
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+# ─────────────────────────────────────────────
+# SEGMENT SPRITES
+# A segment covers a small part of the glyph, but its PNG is the whole
+# canvas, so every composite, colorize and cached copy touched the full tile.
+# A Sprite is the segment cropped to the bounding box of its alpha, plus
+# where that box sits on the canvas. Outside the box is transparent black,
+# so nothing is lost: expand() gives the full canvas back.
+#
+# On disk a sprite is the cropped PNG with a "pekseg-sprite" text chunk
+# holding "x,y,canvas_width,canvas_height" (segment_seperator.py writes
+# these). Plain full-canvas PNGs, like the hand-edited ones in segments/,
+# load too and are cropped on load.
+SPRITE_KEY = "pekseg-sprite"
+SEGMENT_COUNT = 47
+
+class Sprite:
+    def __init__(self, image, offset, canvas):
+        self.image = image    # RGBA, just the bounding box
+        self.offset = offset  # (x, y) of the box on the canvas
+        self.canvas = canvas  # (width, height) of the full glyph
+
+    def __repr__(self):
+        return f"Sprite({self.image.size} at {self.offset} on {self.canvas})"
+
+    @classmethod
+    def from_image(cls, img):
+        """Crop a full-canvas image to its alpha bounding box."""
+        img = img.convert("RGBA")
+        # A blank segment still gets one transparent pixel, so it composites as a no-op
+        box = img.getchannel("A").getbbox() or (0, 0, 1, 1)
+        return cls(img.crop(box), box[:2], img.size)
+
+    @property
+    def box(self):
+        x, y = self.offset
+        return (x, y, x + self.image.width, y + self.image.height)
+
+    def expand(self, image=None):
+        """Full-canvas RGBA of this sprite, or of `image` (same size, e.g. colorized) in its place."""
+        canvas = Image.new("RGBA", self.canvas, (0, 0, 0, 0))
+        canvas.paste(self.image if image is None else image, self.offset)
+        return canvas
+
+    def scaled(self, width, height):
+        """This sprite on a (width, height) canvas, resized like the full PNG would be."""
+        if (width, height) == self.canvas:
+            return self
+        return Sprite.from_image(self.expand().resize((width, height), Image.Resampling.LANCZOS))
+
+    def composite(self, base, image=None):
+        """alpha_composite this sprite (or a same-size variant of it) into its box on `base`."""
+        base.alpha_composite(self.image if image is None else image, self.offset)
+
+    def save(self, path):
+        info = PngInfo()
+        info.add_text(SPRITE_KEY, ",".join(str(v) for v in self.offset + self.canvas))
+        self.image.save(path, pnginfo=info)
+
+def open_sprite(path, size=None):
+    """Load a sprite PNG or a full-canvas PNG as a Sprite, optionally on a (w, h) canvas."""
+    img = Image.open(path)
+    info = img.info.get(SPRITE_KEY)
+    if info is None:
+        # Full canvas: resize first, exactly like the renderers always loaded segments
+        if size is not None:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        return Sprite.from_image(img)
+    x, y, width, height = (int(v) for v in info.split(","))
+    sprite = Sprite(img.convert("RGBA"), (x, y), (width, height))
+    return sprite.scaled(*size) if size is not None else sprite
+
+def open_segment(path):
+    """Full-canvas RGBA image from either kind of segment PNG, for tools that work on whole canvases."""
+    img = Image.open(path)
+    if SPRITE_KEY not in img.info:
+        return img.convert("RGBA")
+    return open_sprite(path).expand()
+
+def load_segment_sprites(folder="segments", glyph_width=80, glyph_height=99, count=SEGMENT_COUNT):
+    return {i: open_sprite(f"{folder}/{i}.png", (glyph_width, glyph_height)) for i in range(count)}
+
+# ─────────────────────────────────────────────
+# CLI
+#   python pekseg_sprites.py crop segments sprites   # full-canvas PNGs -> sprite PNGs
+#   python pekseg_sprites.py info segments           # bounding boxes and sizes
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PEKSEG segment sprites")
+    sub = parser.add_subparsers(dest="command", required=True)
+    crop = sub.add_parser("crop", help="write every PNG in a folder as a cropped sprite")
+    crop.add_argument("source")
+    crop.add_argument("dest")
+    info = sub.add_parser("info", help="print each segment's bounding box")
+    info.add_argument("folder")
+    args = parser.parse_args(argv)
+
+    if args.command == "crop":
+        os.makedirs(args.dest, exist_ok=True)
+        for name in sorted(os.listdir(args.source)):
+            if name.endswith(".png"):
+                sprite = open_sprite(os.path.join(args.source, name))
+                sprite.save(os.path.join(args.dest, name))
+                print(f"{name}: {sprite}")
+    else:
+        full = cropped = 0
+        for name in sorted(os.listdir(args.folder)):
+            if name.endswith(".png"):
+                sprite = open_sprite(os.path.join(args.folder, name))
+                full += sprite.canvas[0] * sprite.canvas[1]
+                cropped += sprite.image.width * sprite.image.height
+                print(f"{name}: {sprite}")
+        if full:
+            print(f"{cropped}/{full} pixels ({cropped / full:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import simpledialog
 from PIL import Image, ImageTk
+from pekseg_sprites import open_sprite
 import os
 
 # Constants
@@ -20,9 +21,9 @@ class PeksegCharacter(tk.Frame):
         self.foreground_on = False
         self.background_on = False
 
-        # Load segment images
-        self.segment_images = {
-            i: Image.open(f"{SEGMENT_FOLDER}/segment_{i:02d}.png").convert("RGBA")
+        # Load segment sprites (cropped, composited into their own boxes)
+        self.segment_sprites = {
+            i: open_sprite(f"{SEGMENT_FOLDER}/segment_{i:02d}.png")
             for i in range(47)
         }
 
@@ -57,10 +58,10 @@ class PeksegCharacter(tk.Frame):
         base = Image.new("RGBA", (CHAR_WIDTH, CHAR_HEIGHT), (0, 0, 0, 255))
         if self.foreground_on:
             for i in FOREGROUND_SEGMENTS:
-                base.alpha_composite(self.segment_images[i])
+                self.segment_sprites[i].composite(base)
         if self.background_on:
             for i in BACKGROUND_SEGMENTS:
-                base.alpha_composite(self.segment_images[i])
+                self.segment_sprites[i].composite(base)
         scaled = base.resize((DISPLAY_WIDTH, DISPLAY_HEIGHT), resample=Image.BICUBIC)
         self.tk_image = ImageTk.PhotoImage(scaled)
         self.canvas.config(width=DISPLAY_WIDTH, height=DISPLAY_HEIGHT)
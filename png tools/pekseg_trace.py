@@ -0,0 +1,74 @@
+# pekseg_trace.py
+import sys
+from collections import deque
+
+# ─────────────────────────────────────────────
+# TRACE
+# Replaces the print-per-byte debugging. Events go into a fixed-size ring
+# buffer and only hit the console when asked for: dump() on demand, or from
+# an except block when something blows up. Call sites check the level first,
+#
+#     if trace.level >= trace.BYTE:
+#         trace.record("PARSER", b, slot=current_index, mode=mode)
+#
+# so with tracing off a trace point is one attribute load and a compare, and
+# nothing gets formatted until dump() time.
+OFF = 0
+INFO = 1   # one event per frame / commit
+DEBUG = 2  # one event per chunk, console action
+BYTE = 3   # one event per byte (parser + dispatch)
+LEVEL_NAMES = {OFF: "OFF", INFO: "INFO", DEBUG: "DEBUG", BYTE: "BYTE"}
+
+RING_SIZE = 4096
+
+level = INFO
+echo = False  # also print each event as it's recorded, like the old prints did
+ring = deque(maxlen=RING_SIZE)
+recorded = 0
+
+def set_level(new_level, echo_events=None):
+    global level, echo
+    level = new_level
+    if echo_events is not None:
+        echo = echo_events
+
+def set_ring_size(size):
+    global ring
+    ring = deque(ring, maxlen=size)
+
+def record(tag, byte=None, op=None, slot=None, mode=None, note=None):
+    """Append one event: (seq, tag, byte, op, slot, mode, note)."""
+    global recorded
+    recorded += 1
+    event = (recorded, tag, byte, op, slot, mode, note)
+    ring.append(event)
+    if echo:
+        print(format_event(event))
+
+def format_event(event):
+    seq, tag, byte, op, slot, mode, note = event
+    parts = [f"#{seq:<7} [{tag}]"]
+    if byte is not None:
+        parts.append(f"byte=0x{byte:02X}")
+    if op is not None:
+        parts.append(f"op={op}")
+    if slot is not None:
+        parts.append(f"slot={slot}")
+    if mode is not None:
+        parts.append(f"mode={mode}")
+    if note:
+        parts.append(str(note))
+    return " ".join(parts)
+
+def dump(file=None, last=None, clear=False):
+    """Print the buffered events, oldest first (only the newest `last` if given)."""
+    file = file or sys.stderr
+    events = list(ring)
+    if last is not None:
+        events = events[-last:]
+    dropped = recorded - len(ring)
+    print(f"[TRACE] {len(events)} events (level {LEVEL_NAMES.get(level, level)}, {dropped} older dropped)", file=file)
+    for event in events:
+        print(format_event(event), file=file)
+    if clear:
+        ring.clear()
@@ -1,5 +1,6 @@
 import tkinter as tk
 from PIL import Image, ImageTk
+from pekseg_sprites import open_segment
 import os
 import shutil
 
@@ -22,7 +23,7 @@ segment_files = sorted(
     key=numeric_key
 )
 
-segment_images = [Image.open(os.path.join(SEGMENT_FOLDER, f)).convert("RGBA") for f in segment_files]
+segment_images = [open_segment(os.path.join(SEGMENT_FOLDER, f)) for f in segment_files]
 DISPLAY_SIZE = (200, 250)
 segment_images = [img.resize(DISPLAY_SIZE, resample=Image.BICUBIC) for img in segment_images]
 current_index = 0
@@ -1,5 +1,6 @@
 import tkinter as tk
 from PIL import Image, ImageTk
+from pekseg_sprites import open_segment
 import json
 import os
 
@@ -23,7 +24,7 @@ segment_files = sorted(
 
 # Load and resize segment images
 segment_images = [
-    Image.open(os.path.join(SEGMENT_FOLDER, f)).convert("RGBA").resize((DISPLAY_WIDTH, DISPLAY_HEIGHT), resample=Image.BICUBIC)
+    open_segment(os.path.join(SEGMENT_FOLDER, f)).resize((DISPLAY_WIDTH, DISPLAY_HEIGHT), resample=Image.BICUBIC)
     for f in segment_files[:SEGMENT_COUNT]
 ]
 
@@ -1,10 +1,12 @@
 import cv2
 import numpy as np
 from PIL import Image
+from pekseg_sprites import Sprite
 
 # This script separates segments from a master PNG image with transparency
 # Make sure the master image has DISTINCE segments with TRANSPARENT backgrounds.
-# Each segment is saved as a separate PNG file with transparency, maintaining the original image size.
+# Each segment is saved as a separate PNG file with transparency, cropped to its bounding box. The box's
+# position and the original image size go in a text chunk, so pekseg_sprites can put it back in place.
 # The segments are saved in a folder named "segments". Please create this folder if it doesn't exist.
 # Ensure you have OpenCV and Pillow installed: pip install opencv-python pillow
 # Usage: Place your master PNG image named "master_pekseg.png" in the same directory as this script and run it.
@@ -15,6 +17,7 @@ from PIL import Image
 # v1.0.0 - Initial segment extraction ritual
 # v1.0.1 - Added sarcasm to credits
 # v1.0.2 - Confirmed the link is dead, but spiritually relevant
+# v1.1.0 - Segments saved as cropped sprites (bounding box + offset) instead of full canvases
 
 
 # Load master image with alpha channel
@@ -47,7 +50,8 @@ for i, cnt in enumerate(contours):
     # Mask the original image with the drawn contour
     isolated = cv2.bitwise_and(img, blank)
 
-    # Save as PNG
-    segment_pil = Image.fromarray(isolated)
-    segment_pil.save(f"segments/segment_{i:02d}.png")
+    # Save just the contour's bounding box, with its offset on the full image
+    x, y, w, h = cv2.boundingRect(cnt)
+    segment_pil = Image.fromarray(isolated[y:y + h, x:x + w])
+    Sprite(segment_pil, (x, y), (width, height)).save(f"segments/segment_{i:02d}.png")
     print(f"Saved segment_{i:02d}.png")
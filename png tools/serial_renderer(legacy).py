@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import filedialog, colorchooser
 from PIL import Image, ImageTk, ImageOps
 import threading, time, colorsys
+from pekseg_sprites import open_sprite
 
 # Config
 GRID_COLS = 12
@@ -21,8 +22,14 @@ user_selected_color = (255, 255, 255)
 # Load segment images
 segment_images = {}
 for i in range(SEGMENT_COUNT):
-    img = Image.open(f"segments/{i}.png").resize((GLYPH_WIDTH, GLYPH_HEIGHT), Image.Resampling.LANCZOS)
-    segment_images[i] = img.convert("RGBA")
+    segment_images[i] = open_sprite(f"segments/{i}.png", (GLYPH_WIDTH, GLYPH_HEIGHT)).expand()
+
+# Faded background layer, the same for every slot: built once, copied per slot
+ghost_layer = Image.new("RGBA", (GLYPH_WIDTH, GLYPH_HEIGHT), (0, 0, 0, 255))
+for i in range(SEGMENT_COUNT):
+    faded = segment_images[i].copy()
+    faded.putalpha(30)
+    ghost_layer.alpha_composite(faded)
 
 # Color logic
 def get_segment_color(i):
@@ -55,13 +62,8 @@ def launch_display():
         for idx, segments in enumerate(glyph_buffer):
             x = (idx % GRID_COLS) * GLYPH_WIDTH
             y = (idx // GRID_COLS) * GLYPH_HEIGHT
-            base = Image.new("RGBA", (GLYPH_WIDTH, GLYPH_HEIGHT), (0, 0, 0, 255))
-
             # Background pass
-            for i in range(SEGMENT_COUNT):
-                faded = segment_images[i].copy()
-                faded.putalpha(30)
-                base.alpha_composite(faded)
+            base = ghost_layer.copy()
 
             # Foreground pass
             for i in segments: